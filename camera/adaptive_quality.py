@@ -0,0 +1,162 @@
+"""
+Adaptive stream quality for the camera.
+
+Viewers report how delivery is going (frames sent and dropped, frames
+waiting in their send queue, round trip time) and AdaptiveQuality moves
+one step along LEVELS per decision:
+
+  down   as soon as an interval looks congested for any viewer: more than
+         DROP_LIMIT of its frames dropped, more than BACKLOG_LIMIT frames
+         queued, or an RTT over RTT_LIMIT
+  up     after UP_AFTER clean intervals in a row, so a link that just
+         recovered is not flooded again straight away
+
+After a change the next interval is skipped, it still shows the old level.
+
+JPEG quality and H.264 bitrate change on the running encoder. A new
+resolution needs the camera reconfigured, which stops recording for a
+moment; the output and with it the viewers' connections stay up.
+"""
+
+import fcntl
+import logging
+import socket
+import struct
+import threading
+import time
+
+from picamera2.encoders import H264Encoder, JpegEncoder
+from picamera2.outputs import FileOutput
+
+log = logging.getLogger("camera.quality")
+
+# (size, JPEG quality, H.264 bitrate), best first
+LEVELS = [
+    ((1280, 720), 80, 3000000),
+    ((1024, 576), 70, 2000000),
+    ((640, 480), 70, 1000000),
+    ((640, 480), 50, 600000),
+    ((480, 360), 40, 350000),
+    ((320, 240), 30, 200000),
+]
+DEFAULT_LEVEL = 2  # What the camera scripts used before
+
+INTERVAL = 1.0
+DROP_LIMIT = 0.1
+BACKLOG_LIMIT = 2
+RTT_LIMIT = 0.3
+UP_AFTER = 5
+
+# From linux/videodev2.h, for changing the bitrate of a running encoder
+VIDIOC_S_CTRL = 0xC008561C
+V4L2_CID_MPEG_VIDEO_BITRATE = 0x009909CF
+# From linux/sockios.h, unsent bytes in a TCP socket's send queue
+SIOCOUTQ = 0x5411
+
+
+def socket_backlog(sock):
+    """Bytes written to a TCP socket the peer has not taken yet"""
+    return struct.unpack("i", fcntl.ioctl(sock.fileno(), SIOCOUTQ, b"\0" * 4))[0]
+
+
+def socket_rtt(sock):
+    """The kernel's smoothed RTT of a TCP socket in seconds (tcp_info.tcpi_rtt)"""
+    info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+    return struct.unpack_from("I", info, 68)[0] / 1e6
+
+
+def set_bitrate(encoder, bitrate):
+    """Change the bitrate of a running V4L2 H.264 encoder"""
+    fcntl.ioctl(encoder.vd, VIDIOC_S_CTRL, struct.pack("Ii", V4L2_CID_MPEG_VIDEO_BITRATE, bitrate))
+
+
+class AdaptiveQuality:
+    def __init__(self, picam2, encoder, output, level=DEFAULT_LEVEL, interval=INTERVAL):
+        self.picam2 = picam2
+        self.encoder = encoder  # A JpegEncoder or H264Encoder
+        self.output = output  # File-like the encoder writes to
+        self.level = level
+        self.interval = interval
+        self.lock = threading.Lock()  # Held while reporting or swapping the window
+        self.window = {}  # viewer -> [sent, dropped, max backlog, max rtt] this interval
+        self.clean = 0
+        self.hold = False
+        self.changes = 0
+
+    def configure(self):
+        size, quality, bitrate = LEVELS[self.level]
+        if isinstance(self.encoder, JpegEncoder):
+            self.encoder.q = quality
+        elif isinstance(self.encoder, H264Encoder):
+            self.encoder.bitrate = bitrate
+        self.picam2.configure(self.picam2.create_video_configuration(main={"size": size}))
+
+    def start_recording(self):
+        """Configure the camera for the current level and start recording"""
+        self.configure()
+        self.picam2.start_recording(self.encoder, FileOutput(self.output))
+
+    def report(self, viewer, sent=0, dropped=0, backlog=0, rtt=None):
+        """Delivery stats from one viewer since its last report, backlog in frames"""
+        with self.lock:
+            stats = self.window.setdefault(viewer, [0, 0, 0, 0.0])
+            stats[0] += sent
+            stats[1] += dropped
+            stats[2] = max(stats[2], backlog)
+            if rtt is not None:
+                stats[3] = max(stats[3], rtt)
+
+    def congested(self, window):
+        for sent, dropped, backlog, rtt in window.values():
+            if dropped > DROP_LIMIT * (sent + dropped) or backlog > BACKLOG_LIMIT or rtt > RTT_LIMIT:
+                return True
+        return False
+
+    def check(self):
+        """Decide on the last interval. Called every interval."""
+        with self.lock:
+            window, self.window = self.window, {}
+        if not window:
+            return  # Nobody watching
+        if self.hold:
+            self.hold = False
+            return
+
+        if self.congested(window):
+            self.clean = 0
+            if self.level < len(LEVELS) - 1:
+                self.set_level(self.level + 1)
+        else:
+            self.clean += 1
+            if self.clean >= UP_AFTER and self.level > 0:
+                self.clean = 0
+                self.set_level(self.level - 1)
+
+    def set_level(self, level):
+        old_size = LEVELS[self.level][0]
+        size, quality, bitrate = LEVELS[level]
+        log.info("Stream quality %d -> %d: %dx%d, JPEG quality %d, %d kbit/s",
+                 self.level, level, size[0], size[1], quality, bitrate // 1000)
+        self.level = level
+        self.changes += 1
+        self.hold = True
+
+        if size != old_size:
+            self.picam2.stop_recording()
+            self.start_recording()
+        elif isinstance(self.encoder, JpegEncoder):
+            self.encoder.q = quality
+        elif isinstance(self.encoder, H264Encoder):
+            self.encoder.bitrate = bitrate
+            set_bitrate(self.encoder, bitrate)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                log.exception("Stream quality change failed")
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
@@ -0,0 +1,172 @@
+"""
+CPU and power cost per frame of the two WebRTC streaming paths.
+
+  jpeg   hardware JPEG encode, then per frame cv2.imdecode, cvtColor to RGB
+         and aiortc's software H.264 encode (camera_test2.py's default)
+  h264   hardware H.264 encode, then per frame only aiortc's RTP
+         packetization of the encoder's output (SDP051_CAMERA_MODE=h264)
+
+Each mode runs the real per-frame work for --seconds without a peer and
+reports the frame rate it kept up, the CPU use of this process and of the
+whole system, and on boards with a PMIC (Pi 5) the power draw and frames
+per joule. Elsewhere measure watts with a USB meter and divide.
+
+    python bench_stream.py [--seconds 20] [--size 1280x720] [--mode both]
+"""
+
+import argparse
+import fractions
+import io
+import queue
+import re
+import subprocess
+import threading
+import time
+
+import av
+import cv2
+import numpy as np
+from aiortc.codecs.h264 import H264Encoder as RtpH264Encoder
+from picamera2 import Picamera2
+from picamera2.encoders import H264Encoder, JpegEncoder
+from picamera2.outputs import FileOutput
+
+from h264_stream import TIME_BASE
+
+H264_BITRATE = 1000000
+
+
+class QueueOutput(io.BufferedIOBase):
+    """Encoded frames from the camera thread to the worker, dropping when it falls behind"""
+    def __init__(self):
+        self.queue = queue.Queue(2)
+        self.dropped = 0
+
+    def write(self, buf):
+        try:
+            self.queue.put_nowait(bytes(buf))
+        except queue.Full:
+            self.dropped += 1
+        return len(buf)
+
+
+def jpeg_path():
+    """camera_test2.py's CameraVideoTrack plus the encode aiortc does for each peer"""
+    encoder = RtpH264Encoder()
+    time_base = fractions.Fraction(1, 1_000_000)
+
+    def process(data, pts):
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        video_frame = av.VideoFrame.from_ndarray(frame, format="rgb24")
+        video_frame.pts = pts // 1000
+        video_frame.time_base = time_base
+        encoder.encode(video_frame)
+    return JpegEncoder(), process
+
+
+def h264_path():
+    """H264Track plus the packetization aiortc does for each peer"""
+    encoder = RtpH264Encoder()
+
+    def process(data, pts):
+        packet = av.Packet(data)
+        packet.pts = int(pts / 1e9 / TIME_BASE)
+        packet.time_base = TIME_BASE
+        encoder.pack(packet)
+    return H264Encoder(H264_BITRATE, repeat=True, iperiod=30), process
+
+
+PATHS = {"jpeg": jpeg_path, "h264": h264_path}
+
+
+def system_cpu():
+    """(busy, total) jiffies from /proc/stat"""
+    with open("/proc/stat") as f:
+        values = [int(v) for v in f.readline().split()[1:]]
+    idle = values[3] + values[4]
+    return sum(values) - idle, sum(values)
+
+
+def read_power():
+    """Watts drawn by the board from the Pi 5 PMIC, or None"""
+    try:
+        output = subprocess.run(["vcgencmd", "pmic_read_adc"], capture_output=True,
+                                text=True, timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    currents = dict(re.findall(r"(\w+)_A current\(\d+\)=([\d.]+)A", output))
+    volts = dict(re.findall(r"(\w+)_V volt\(\d+\)=([\d.]+)V", output))
+    rails = currents.keys() & volts.keys()
+    if not rails:
+        return None
+    return sum(float(currents[rail]) * float(volts[rail]) for rail in rails)
+
+
+def sample_power(stop, readings, interval=0.5):
+    while not stop.wait(interval):
+        watts = read_power()
+        if watts is None:
+            return
+        readings.append(watts)
+
+
+def run(picam2, mode, seconds):
+    encoder, process = PATHS[mode]()
+    output = QueueOutput()
+    picam2.start_recording(encoder, FileOutput(output))
+    time.sleep(1)  # Let the camera settle before measuring
+
+    stop = threading.Event()
+    readings = []
+    sampler = threading.Thread(target=sample_power, args=(stop, readings), daemon=True)
+    sampler.start()
+
+    frames = 0
+    dropped = output.dropped
+    cpu_start, (busy_start, total_start) = time.process_time(), system_cpu()
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        try:
+            data = output.queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        process(data, time.monotonic_ns())
+        frames += 1
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    busy_end, total_end = system_cpu()
+
+    stop.set()
+    sampler.join()
+    picam2.stop_recording()
+
+    fps = frames / wall
+    line = (f"{mode}: {fps:.1f} fps, dropped {output.dropped - dropped}, "
+            f"process cpu {100 * cpu / wall:.0f}% ({1000 * cpu / max(frames, 1):.1f} ms/frame), "
+            f"system cpu {100 * (busy_end - busy_start) / max(total_end - total_start, 1):.0f}%")
+    if readings:
+        watts = sum(readings) / len(readings)
+        line += f", {watts:.2f} W, {fps / watts:.1f} frames/J"
+    else:
+        line += ", power n/a"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--mode", default="both", choices=["both", *PATHS])
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.split("x"))
+    picam2 = Picamera2()
+    picam2.configure(picam2.create_video_configuration(main={"size": size}))
+    print(f"size={size[0]}x{size[1]} seconds={args.seconds}")
+    for mode in PATHS if args.mode == "both" else [args.mode]:
+        run(picam2, mode, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
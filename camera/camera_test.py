@@ -1,12 +1,13 @@
 from picamera2 import Picamera2
 from picamera2.encoders import JpegEncoder
-from picamera2.outputs import FileOutput
 import io
 import logging
 import socketserver
 from http import server
 from threading import Condition
 
+from adaptive_quality import AdaptiveQuality, socket_backlog, socket_rtt
+
 # HTML for the web page
 PAGE = """\
 <html>
@@ -15,22 +16,39 @@ PAGE = """\
 </head>
 <body>
 <h1>Raspberry Pi Camera Stream</h1>
-<img src="stream.mjpg" width="640" height="480" />
+<img src="stream.mjpg" width="640" />
 </body>
 </html>
 """
 
 class StreamingOutput(io.BufferedIOBase):
+    """
+    Latest camera frame for all viewers. Each JPEG gets its multipart
+    headers once here, viewers share that one buffer and wait on the
+    generation number, so a slow viewer skips to the newest frame instead
+    of falling behind.
+    """
     def __init__(self):
         self.frame = None
+        self.generation = 0
         self.condition = Condition()
 
     def write(self, buf):
+        frame = memoryview(b"".join((
+            b"--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(buf),
+            buf, b"\r\n")))
         with self.condition:
-            self.frame = buf
+            self.frame = frame
+            self.generation += 1
             self.condition.notify_all()
         return len(buf)
 
+    def wait(self, generation):
+        """Newest (generation, frame) after the given generation"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.generation != generation)
+            return self.generation, self.frame
+
 class StreamingHandler(server.BaseHTTPRequestHandler):
     def do_GET(self):
         if self.path == '/':
@@ -47,16 +65,16 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
             self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
             self.end_headers()
             try:
+                generation = 0
                 while True:
-                    with output.condition:
-                        output.condition.wait()
-                        frame = output.frame
-                    self.wfile.write(b'--FRAME\r\n')
-                    self.send_header('Content-Type', 'image/jpeg')
-                    self.send_header('Content-Length', len(frame))
-                    self.end_headers()
+                    last = generation
+                    generation, frame = output.wait(generation)
                     self.wfile.write(frame)
-                    self.wfile.write(b'\r\n')
+                    # Frames skipped and still queued feed the quality controller
+                    quality.report(self.client_address, sent=1,
+                                   dropped=generation - last - 1 if last else 0,
+                                   backlog=socket_backlog(self.connection) / len(frame),
+                                   rtt=socket_rtt(self.connection))
             except Exception as e:
                 logging.warning(
                     'Removed streaming client %s: %s',
@@ -69,11 +87,14 @@ class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     allow_reuse_address = True
     daemon_threads = True
 
-# Set up the camera
+# Set up the camera, resolution and JPEG quality follow the viewers'
+# connections (see adaptive_quality.py)
+logging.basicConfig(level=logging.INFO)
 picam2 = Picamera2()
-picam2.configure(picam2.create_video_configuration(main={"size": (640, 480)}))
 output = StreamingOutput()
-picam2.start_recording(JpegEncoder(), FileOutput(output))
+quality = AdaptiveQuality(picam2, JpegEncoder(), output)
+quality.start_recording()
+quality.start()
 
 # Start the web server
 try:
@@ -1,36 +1,87 @@
 import asyncio
 import cv2
+import fractions
 import numpy as np
+import os
 from aiohttp import web
-from aiortc import RTCPeerConnection, VideoStreamTrack
+from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
 from aiortc.contrib.media import MediaRelay
 from picamera2 import Picamera2
-from picamera2.encoders import JpegEncoder
+from picamera2.encoders import H264Encoder, JpegEncoder
 from picamera2.outputs import FileOutput
 import io
-from threading import Condition
 
-# Global frame holder
+from adaptive_quality import INTERVAL, AdaptiveQuality
+from h264_stream import H264Source, h264_codecs
+
+# "jpeg" decodes the camera's JPEGs and has aiortc encode them again,
+# "h264" forwards the hardware encoder's H.264 as is (see h264_stream.py),
+# with resolution and bitrate following the peers' RTCP reports.
+# bench_stream.py compares the two.
+STREAM_MODE = os.environ.get("SDP051_CAMERA_MODE", "jpeg")
+H264_KEYFRAME_INTERVAL = 30  # Frames, also how long a new viewer may wait for a picture
+
+# Camera frames into the event loop. The camera thread never blocks the
+# loop, it schedules the frame in and only the newest one is kept.
 class FrameOutput(io.BufferedIOBase):
     def __init__(self):
-        self.frame = None
-        self.condition = Condition()
+        self.loop = None
+        self.queue = None
+        self.dropped = 0
+
+    def start(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(1)
 
     def write(self, buf):
-        with self.condition:
-            self.frame = buf
-            self.condition.notify_all()
+        self.loop.call_soon_threadsafe(self.put, bytes(buf))
         return len(buf)
 
+    def put(self, frame):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
 frame_output = FrameOutput()
+h264_source = None
+camera_track = None  # Shared by all peers through the relay
+quality = None
 
-# Start the Pi camera
 picam2 = Picamera2()
 picam2.configure(picam2.create_video_configuration(main={"size": (640, 480)}))
-picam2.start_recording(JpegEncoder(), FileOutput(frame_output))
 
 
-# Create aiortc VideoTrack
+# Start the Pi camera once the event loop runs, the outputs hand frames
+# to it
+async def start_camera(app):
+    global h264_source, camera_track, quality
+    if STREAM_MODE == "h264":
+        h264_source = H264Source(asyncio.get_running_loop())
+        encoder = H264Encoder(repeat=True, iperiod=H264_KEYFRAME_INTERVAL)
+        quality = AdaptiveQuality(picam2, encoder, h264_source)
+        quality.start_recording()
+        quality.start()
+    else:
+        frame_output.start(asyncio.get_running_loop())
+        camera_track = CameraVideoTrack()
+        picam2.start_recording(JpegEncoder(), FileOutput(frame_output))
+
+
+async def stop_camera(app):
+    await asyncio.gather(*(pc.close() for pc in pcs))
+    picam2.stop_recording()
+
+
+def decode_jpeg(jpeg_data):
+    """JPEG to an RGB ndarray"""
+    img_array = np.frombuffer(jpeg_data, dtype=np.uint8)
+    frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+# Create aiortc VideoTrack. There is one for the camera, each peer gets a
+# relay subscription to it so frames are decoded once however many watch.
 class CameraVideoTrack(VideoStreamTrack):
     def __init__(self):
         super().__init__()
@@ -39,15 +90,11 @@ class CameraVideoTrack(VideoStreamTrack):
         from av import VideoFrame
         import time
 
-        # Wait for the next frame
-        with frame_output.condition:
-            frame_output.condition.wait()
-            jpeg_data = frame_output.frame
+        # Wait for the next frame without blocking the loop
+        jpeg_data = await frame_output.queue.get()
 
-        # Decode JPEG to ndarray
-        img_array = np.frombuffer(jpeg_data, dtype=np.uint8)
-        frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Decode off the loop so signaling and the other peers keep going
+        frame = await asyncio.get_running_loop().run_in_executor(None, decode_jpeg, jpeg_data)
 
         # Create VideoFrame
         video_frame = VideoFrame.from_ndarray(frame, format="rgb24")
@@ -56,6 +103,23 @@ class CameraVideoTrack(VideoStreamTrack):
         return video_frame
 
 
+async def report_stats(pc, sender, track):
+    """Feed a peer's delivery stats to the quality controller"""
+    sent, dropped = track.sent, track.dropped
+    while pc.connectionState not in ("failed", "closed"):
+        await asyncio.sleep(INTERVAL)
+        rtt, lost = None, 0.0
+        for stats in (await sender.getStats()).values():
+            if stats.type == "remote-inbound-rtp":
+                # From the last RTCP receiver report, fractionLost is out of 256
+                rtt, lost = stats.roundTripTime, stats.fractionLost / 256
+        frames = track.sent - sent
+        quality.report(id(pc), sent=frames,
+                       dropped=track.dropped - dropped + round(frames * lost),
+                       backlog=track.queue.qsize(), rtt=rtt)
+        sent, dropped = track.sent, track.dropped
+
+
 # WebRTC signaling
 pcs = set()
 relay = MediaRelay()
@@ -67,8 +131,25 @@ async def offer(request):
     pc = RTCPeerConnection()
     pcs.add(pc)
 
-    video_track = CameraVideoTrack()
-    pc.addTrack(video_track)
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        if pc.connectionState in ("failed", "closed"):
+            for sender in pc.getSenders():
+                if sender.track:
+                    sender.track.stop()
+            await pc.close()
+            pcs.discard(pc)
+
+    if STREAM_MODE == "h264":
+        # Passthrough only works if the browser takes H.264
+        track = h264_source.track()
+        sender = pc.addTrack(track)
+        transceiver = next(t for t in pc.getTransceivers() if t.sender == sender)
+        transceiver.setCodecPreferences(h264_codecs())
+        asyncio.ensure_future(report_stats(pc, sender, track))
+    else:
+        # Unbuffered, a slow peer gets the newest frame instead of a backlog
+        pc.addTrack(relay.subscribe(camera_track, buffered=False))
 
     await pc.setRemoteDescription(offer)
     answer = await pc.createAnswer()
@@ -83,6 +164,8 @@ async def offer(request):
 # Routes and app
 app = web.Application()
 app.router.add_post("/offer", offer)
+app.on_startup.append(start_camera)
+app.on_shutdown.append(stop_camera)
 
 # Run the server
 web.run_app(app, port=8080)
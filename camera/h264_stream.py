@@ -0,0 +1,118 @@
+"""
+H.264 passthrough to WebRTC.
+
+The Pi's hardware encoder already produces H.264, so instead of decoding
+JPEGs and having aiortc encode them again in software, H264Source hands
+each encoded frame to aiortc as an av.Packet and aiortc only splits its
+NAL units into RTP packets. The peer has to negotiate H.264 for this, see
+h264_codecs().
+
+Encoded frames depend on the ones before them, so a viewer cannot simply
+skip to the newest one like with JPEGs. A track that falls QUEUE_SIZE
+frames behind drops its backlog and waits for the next keyframe instead,
+as does a new track. The encoder should repeat SPS/PPS with every
+keyframe (H264Encoder(repeat=True)) so viewers can start at any of them.
+"""
+
+import asyncio
+import fractions
+import io
+import time
+
+import av
+from aiortc import MediaStreamTrack, RTCRtpSender
+
+TIME_BASE = fractions.Fraction(1, 90000)  # RTP video clock
+QUEUE_SIZE = 15
+
+NAL_SLICE = 1
+NAL_IDR = 5
+
+
+def is_keyframe(data):
+    """Check if an Annex B access unit starts with an IDR slice, looking only up to the first slice"""
+    i = data.find(b"\x00\x00\x01")
+    while i != -1 and i + 3 < len(data):
+        nal_type = data[i + 3] & 0x1F
+        if nal_type == NAL_IDR:
+            return True
+        if nal_type == NAL_SLICE:
+            return False
+        i = data.find(b"\x00\x00\x01", i + 3)
+    return False
+
+
+def h264_codecs():
+    """aiortc's H.264 codecs, for RTCRtpTransceiver.setCodecPreferences"""
+    return [codec for codec in RTCRtpSender.getCapabilities("video").codecs
+            if codec.mimeType == "video/H264"]
+
+
+class H264Source(io.BufferedIOBase):
+    """
+    File-like output for Picamera2's FileOutput. Each write is one encoded
+    frame from the camera thread, passed on to every track in `loop`.
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self.tracks = set()
+        self.start = None
+        self.frames = 0
+
+    def write(self, buf):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        pts = int((now - self.start) / TIME_BASE)
+        data = bytes(buf)
+        self.frames += 1
+        self.loop.call_soon_threadsafe(self.dispatch, data, pts, is_keyframe(data))
+        return len(buf)
+
+    def dispatch(self, data, pts, keyframe):
+        for track in self.tracks:
+            track.put(data, pts, keyframe)
+
+    def track(self):
+        """A new track for one peer, it starts at the next keyframe"""
+        track = H264Track(self)
+        self.tracks.add(track)
+        return track
+
+
+class H264Track(MediaStreamTrack):
+    kind = "video"
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.synced = False  # False while waiting for a keyframe
+        self.sent = 0
+        self.dropped = 0
+
+    def put(self, data, pts, keyframe):
+        if self.queue.full():
+            # Behind, everything queued is stale and the frames after it
+            # reference what gets dropped
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.synced = False
+        if not self.synced and not keyframe:
+            self.dropped += 1
+            return
+        self.synced = True
+        self.queue.put_nowait((data, pts))
+
+    async def recv(self):
+        data, pts = await self.queue.get()
+        self.sent += 1
+        packet = av.Packet(data)
+        packet.pts = pts
+        packet.time_base = TIME_BASE
+        return packet
+
+    def stop(self):
+        super().stop()
+        self.source.tracks.discard(self)
@@ -0,0 +1,67 @@
+"""
+Sending camera frames over UDP in fragments.
+
+A JPEG is usually bigger than one datagram, so every frame is split and
+each piece is sent with an 8 byte header, network byte order:
+
+    uint32 frame id   counts up per frame, wraps
+    uint16 index      0 to count - 1
+    uint16 count      fragments in this frame
+
+followed by the payload. Every fragment but the last carries exactly
+FRAGMENT_SIZE bytes, so the receiver can place fragments by index as they
+arrive in any order. The server side is frame_reassembler.py, keep the two
+in sync.
+"""
+
+import io
+import socket
+import struct
+
+HEADER = struct.Struct("!IHH")
+# Header + payload stays under a 1500 byte MTU, so IP never fragments
+FRAGMENT_SIZE = 1400
+MAX_FRAGMENTS = 0xFFFF
+
+
+def fragments(frame_id, data):
+    """The datagrams for one frame"""
+    data = memoryview(data)
+    count = max(1, -(-len(data) // FRAGMENT_SIZE))
+    if count > MAX_FRAGMENTS:
+        raise ValueError(f"frame of {len(data)} bytes is too big to send")
+    for index in range(count):
+        payload = data[index * FRAGMENT_SIZE:(index + 1) * FRAGMENT_SIZE]
+        yield HEADER.pack(frame_id, index, count) + payload
+
+
+class FragmentWriter(io.BufferedIOBase):
+    """
+    File-like output for Picamera2's FileOutput. Each write is one encoded
+    frame, which goes out on `sock` (already connected) as fragments.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.frame_id = 0
+        self.frames = 0
+        self.send_errors = 0
+
+    def write(self, buf):
+        self.frame_id = (self.frame_id + 1) & 0xFFFFFFFF
+        try:
+            for datagram in fragments(self.frame_id, buf):
+                self.sock.send(datagram)
+            self.frames += 1
+        except OSError:
+            # Nobody listening (ECONNREFUSED) or the send buffer is full,
+            # the frame is lost either way and the next one starts clean
+            self.send_errors += 1
+        return len(buf)
+
+
+def open_sender(address, sndbuf=1 << 20):
+    """UDP socket connected to address, with room for a whole frame's burst"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    sock.connect(address)
+    return sock
@@ -0,0 +1,76 @@
+"""
+Command-to-actuation benchmark for the Pi controller, runs on any Linux box.
+
+Control frames go through car_test.apply_frame, the same path pi_frame and
+the direct channel use, onto a drive train with the simulated GPIO backend.
+For each frame the time from handing it over to the last duty cycle write
+it caused is recorded, then frames are pushed back to back for throughput.
+
+Needs python-socketio (car_test.py creates its client on import).
+
+    python bench_actuation.py [frames]
+"""
+
+import statistics
+import sys
+import time
+
+import car_test
+from control_frame import encode_frame
+from drive_train import DriveTrain, SimulatedBackend
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    def pct(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1e6
+    print(f"{name}: n={len(samples)} mean={statistics.mean(samples) * 1e6:.1f}us "
+          f"p50={pct(50):.1f}us p90={pct(90):.1f}us p99={pct(99):.1f}us max={samples[-1] * 1e6:.1f}us")
+
+
+def make_frames(count):
+    """Frames sweeping throttle and steering in the browser's 5% steps"""
+    return [encode_frame((seq * 5) % 205 - 100, 100 - (seq * 15) % 205, seq % 65536, 0)
+            for seq in range(1, count + 1)]
+
+
+def bench_latency(backend, frames):
+    samples = []
+    for frame in frames:
+        written = len(backend.events)
+        start = time.perf_counter()
+        car_test.apply_frame(frame)
+        if len(backend.events) > written:
+            samples.append(backend.events[-1][0] - start)
+    return samples
+
+
+def bench_throughput(backend, frames):
+    written = len(backend.events)
+    start = time.perf_counter()
+    for frame in frames:
+        car_test.apply_frame(frame)
+    elapsed = time.perf_counter() - start
+    print(f"throughput: {len(frames) / elapsed:.0f} frames/s, "
+          f"{(len(backend.events) - written) / elapsed:.0f} duty writes/s")
+
+
+def bench_dedup(frames):
+    """Frames a joystick held still would send: the same values again and again"""
+    car_test.drive_train = drive_train = DriveTrain(SimulatedBackend())
+    car_test.last_seq = None
+    for frame in frames:
+        car_test.apply_frame(frame)
+    print(f"held joystick: {drive_train.writer.stats()}")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    backend = SimulatedBackend()
+    car_test.drive_train = DriveTrain(backend)
+
+    report("frame -> duty", bench_latency(backend, make_frames(count)))
+    car_test.last_seq = None
+    bench_throughput(backend, make_frames(count))
+    print(f"sweep: {car_test.drive_train.writer.stats()}")
+    bench_dedup([encode_frame(40, 0, seq, 0) for seq in range(1, count + 1)])
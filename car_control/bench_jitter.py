@@ -0,0 +1,118 @@
+"""
+PWM timing jitter harness.
+
+Commands are applied at the control rate (50 Hz, like the server's control
+slot) while optional load runs next to them: busy threads in this process
+stand in for the Socket.IO client, busy processes for the camera encoder.
+
+  command jitter   with the simulated backend, how far each duty cycle
+                   write lands from its slot on the 20 ms grid. Runs
+                   anywhere.
+  edge jitter      on a Pi with pigpiod running, --edges PIN also times
+                   the rising edges of the real PWM output on PIN (23 is
+                   the throttle pin the commands drive) through
+                   pigpio callbacks, and reports how far each period is
+                   from 1/PWM_FREQ. Compare --backend rpigpio with pigpio.
+
+    python bench_jitter.py [--seconds 5] [--threads 2] [--procs 1]
+    python bench_jitter.py --backend pigpio --edges 23 --procs 3
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import threading
+import time
+
+from drive_train import FB_PIN1, PWM_FREQ, DriveTrain, SimulatedBackend, make_backend
+
+COMMAND_PERIOD = 1 / 50
+
+
+def burn(stop):
+    """CPU load until stop is set"""
+    while not stop.is_set():
+        sum(range(10000))
+
+
+def report(name, deviations):
+    deviations = sorted(abs(d) for d in deviations)
+    def pct(p):
+        return deviations[min(len(deviations) - 1, int(p / 100 * len(deviations)))] * 1e6
+    print(f"{name}: n={len(deviations)} mean={statistics.mean(deviations) * 1e6:.1f}us "
+          f"p50={pct(50):.1f}us p99={pct(99):.1f}us max={deviations[-1] * 1e6:.1f}us")
+
+
+def drive(drive_train, seconds):
+    """
+    Alternate between two throttle values every COMMAND_PERIOD so each
+    command is a real write. Returns the scheduled time of every command.
+    """
+    scheduled = []
+    start = time.perf_counter()
+    for i in range(int(seconds / COMMAND_PERIOD)):
+        due = start + i * COMMAND_PERIOD
+        time.sleep(max(0.0, due - time.perf_counter()))
+        scheduled.append(due)
+        drive_train.set_forward_backward(40 if i % 2 else 60)
+    return scheduled
+
+
+def capture_edges(pin):
+    """Start timing rising edges on pin with pigpio, returns (ticks, stop)"""
+    import pigpio
+    conn = pigpio.pi()
+    if not conn.connected:
+        raise RuntimeError("pigpio daemon not running (start it with: sudo pigpiod)")
+    ticks = []
+    callback = conn.callback(pin, pigpio.RISING_EDGE, lambda gpio, level, tick: ticks.append(tick))
+
+    def stop():
+        callback.cancel()
+        conn.stop()
+    return ticks, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="sim", help="sim (default), auto, rpigpio, pigpio or gpiozero")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="busy threads in this process")
+    parser.add_argument("--procs", type=int, default=0, help="busy processes")
+    parser.add_argument("--edges", type=int, metavar="PIN", help="time the PWM output on PIN (needs pigpiod)")
+    args = parser.parse_args()
+
+    backend = SimulatedBackend() if args.backend == "sim" else make_backend(args.backend)
+    drive_train = DriveTrain(backend)
+
+    thread_stop = threading.Event()
+    proc_stop = multiprocessing.Event()
+    load = [threading.Thread(target=burn, args=(thread_stop,), daemon=True) for _ in range(args.threads)]
+    load += [multiprocessing.Process(target=burn, args=(proc_stop,), daemon=True) for _ in range(args.procs)]
+    for worker in load:
+        worker.start()
+
+    ticks, stop_edges = capture_edges(args.edges) if args.edges is not None else (None, None)
+    try:
+        scheduled = drive(drive_train, args.seconds)
+    finally:
+        thread_stop.set()
+        proc_stop.set()
+        if stop_edges:
+            stop_edges()
+        drive_train.close()
+
+    print(f"backend={args.backend} threads={args.threads} procs={args.procs}")
+    if isinstance(backend, SimulatedBackend):
+        # the throttle pin written by each command, in order
+        writes = [t for t, pin, duty in backend.events if pin == FB_PIN1 and duty > 0]
+        report("command jitter", [write - due for write, due in zip(writes, scheduled)])
+    if ticks:
+        period = 1e6 / PWM_FREQ
+        # pigpio ticks are microseconds and wrap at 2^32
+        periods = [((b - a) & 0xFFFFFFFF) for a, b in zip(ticks, ticks[1:])]
+        report("edge jitter", [(p - period) / 1e6 for p in periods])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,216 +1,215 @@
+import logging
+import logging.handlers
+import os
+import queue
 import socketio
-import RPi.GPIO as gpio
+import threading
 import time
 
+from control_frame import CONTROL, STOP, decode_frame, seq_newer
+from drive_train import DriveTrain, make_backend
+from watchdog import Watchdog
+
 # Configure Socket.IO client
 sio = socketio.Client()
 
+# Logging goes through a queue, a listener thread does the writing so motor
+# updates never block on stdout. Levels per subsystem come from
+# SDP051_LOG_LEVELS, e.g. "motor=DEBUG" to see every duty cycle change.
+log = logging.getLogger("car")
+link_log = logging.getLogger("car.link")
+
+def setup_logging():
+    """Send the car loggers through a background listener"""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logging.handlers.QueueListener(log_queue, handler).start()
+
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    for item in filter(None, os.environ.get("SDP051_LOG_LEVELS", "").split(",")):
+        name, _, level = item.partition("=")
+        try:
+            logging.getLogger(f"car.{name.strip()}").setLevel(level.strip().upper())
+        except ValueError:
+            # a typo in the environment shouldn't keep the car from starting
+            log.warning("Ignoring unknown log level in SDP051_LOG_LEVELS: %s", item)
+
 # Server URL - Change this to your actual server address
 SERVER_URL = "http://32.219.174.238:4000"  # Replace with your server's IP
 
-# Motor control pins
-# Left/right pins
-LR_PIN1 = 17  # Left
-LR_PIN2 = 22  # Right
-# Forward/backward pins 
-FB_PIN1 = 23  # Forward
-FB_PIN2 = 24  # Backward
+# Direct control over WebRTC (see direct_control.py), enabled by sharing
+# the server's SDP051_PI_SECRET
+PI_CONTROL_SECRET = os.environ.get("SDP051_PI_SECRET")
+DIRECT_CONTROL_PORT = 8081
+direct_control = None
 
-# PWM settings
-PWM_FREQ = 100  # PWM frequency in Hz
-fb_pwm = None
-lr_pwm = None
+# Motors, see drive_train.py. The GPIO library is picked with
+# SDP051_GPIO_BACKEND (auto, rpigpio, pigpio, gpiozero or sim). The default
+# uses pigpio's DMA-timed PWM when pigpiod runs, else RPi.GPIO.
+drive_train = None
 
-# Current state tracking
-current_fb_speed = 0  # -100 to 100
-current_lr_speed = 0  # -100 to 100
+last_seq = None  # Sequence number of the last applied control frame
+stopped = False  # Emergency stop latched until the server starts the next control session
+# Frames come from the Socket.IO thread and from the direct channel's asyncio
+# thread. Held from checking last_seq/stopped to setting the motors, so a
+# frame that passed the check can't drive the car after a STOP latched.
+frame_lock = threading.Lock()
+
+# Dead-man watchdog: only control frames feed it, the driver's page resends
+# its command every 0.1s as a keepalive. After WATCHDOG_TIMEOUT seconds without
+# one the motors ramp to neutral over WATCHDOG_RAMP_TIME seconds.
+WATCHDOG_TIMEOUT = 0.3
+WATCHDOG_RAMP_TIME = 0.3
+watchdog = Watchdog(lambda: drive_train, timeout=WATCHDOG_TIMEOUT, ramp_time=WATCHDOG_RAMP_TIME)
 
 def setup_gpio():
-    """Initialize GPIO pins with PWM support"""
-    global fb_pwm, lr_pwm
-    
-    # Clean up any previous GPIO setup
-    gpio.setwarnings(False)
-    try:
-        gpio.cleanup()
-    except:
-        pass
-    
-    # Set GPIO mode
-    gpio.setmode(gpio.BCM)
-    
-    # Setup direction pins
-    gpio.setup(LR_PIN1, gpio.OUT)
-    gpio.setup(LR_PIN2, gpio.OUT)
-    gpio.setup(FB_PIN1, gpio.OUT)
-    gpio.setup(FB_PIN2, gpio.OUT)
-    
-    # Initialize all pins to OFF
-    gpio.output(LR_PIN1, False)
-    gpio.output(LR_PIN2, False)
-    gpio.output(FB_PIN1, False)
-    gpio.output(FB_PIN2, False)
-    
-    # Setup PWM on all pins
-    fb_pwm = [gpio.PWM(FB_PIN1, PWM_FREQ), gpio.PWM(FB_PIN2, PWM_FREQ)]
-    lr_pwm = [gpio.PWM(LR_PIN1, PWM_FREQ), gpio.PWM(LR_PIN2, PWM_FREQ)]
-    
-    # Start PWM with 0% duty cycle (stopped)
-    for pwm in fb_pwm + lr_pwm:
-        pwm.start(0)
-    
-    print("GPIO initialized with PWM and ready for control")
+    """Initialize the drive train, motors stopped"""
+    global drive_train
+
+    if drive_train is not None:
+        drive_train.close()
+    drive_train = DriveTrain(make_backend())
+    log.info("GPIO initialized with PWM and ready for control")
 
 def set_forward_backward(speed_percent):
     """
     Set forward/backward movement with speed control
     speed_percent: -100 to 100, negative for backward, positive for forward
     """
-    global current_fb_speed
-    
     # Ensure PWM is available
-    if fb_pwm is None:
+    if drive_train is None:
         return
-    
-    # Limit to valid range
-    speed_percent = max(-100, min(100, speed_percent))
-    current_fb_speed = speed_percent
-    
-    abs_speed = abs(speed_percent)
-    
-    # Map 0-100 to PWM duty cycle (adjust this range as needed for your motors)
-    # For some motors, lower values might not move the motor, so we add a minimum
-    if abs_speed > 0:
-        duty_cycle = 20 + (abs_speed * 0.8)  # Scale 0-100 to 20-100
-    else:
-        duty_cycle = 0
-    
-    # Set direction based on sign and apply PWM
-    if speed_percent > 0:  # Forward
-        fb_pwm[0].ChangeDutyCycle(duty_cycle)  # FB_PIN1
-        fb_pwm[1].ChangeDutyCycle(0)           # FB_PIN2
-        print(f"Moving forward at {duty_cycle}% duty cycle")
-    elif speed_percent < 0:  # Backward
-        fb_pwm[0].ChangeDutyCycle(0)           # FB_PIN1
-        fb_pwm[1].ChangeDutyCycle(duty_cycle)  # FB_PIN2
-        print(f"Moving backward at {duty_cycle}% duty cycle")
-    else:  # Stop
-        fb_pwm[0].ChangeDutyCycle(0)
-        fb_pwm[1].ChangeDutyCycle(0)
-        print("Stopped forward/backward movement")
+    drive_train.set_forward_backward(speed_percent)
 
 def set_left_right(speed_percent):
     """
     Set left/right turning with speed control
     speed_percent: -100 to 100, negative for left, positive for right
     """
-    global current_lr_speed
-    
     # Ensure PWM is available
-    if lr_pwm is None:
+    if drive_train is None:
         return
-    
-    # Limit to valid range
-    speed_percent = max(-100, min(100, speed_percent))
-    current_lr_speed = speed_percent
-    
-    abs_speed = abs(speed_percent)
-    
-    # Map 0-100 to PWM duty cycle (adjust this range as needed for your motors)
-    # For some motors, lower values might not move the motor, so we add a minimum
-    if abs_speed > 0:
-        duty_cycle = 20 + (abs_speed * 0.8)  # Scale 0-100 to 20-100
-    else:
-        duty_cycle = 0
-    
-    # Set direction based on sign and apply PWM
-    if speed_percent > 0:  # Right
-        lr_pwm[0].ChangeDutyCycle(0)           # LR_PIN1
-        lr_pwm[1].ChangeDutyCycle(duty_cycle)  # LR_PIN2
-        print(f"Turning right at {duty_cycle}% duty cycle")
-    elif speed_percent < 0:  # Left
-        lr_pwm[0].ChangeDutyCycle(duty_cycle)  # LR_PIN1
-        lr_pwm[1].ChangeDutyCycle(0)           # LR_PIN2
-        print(f"Turning left at {duty_cycle}% duty cycle")
-    else:  # Stop turning
-        lr_pwm[0].ChangeDutyCycle(0)
-        lr_pwm[1].ChangeDutyCycle(0)
-        print("Stopped turning")
+    drive_train.set_left_right(speed_percent)
 
 def cleanup_gpio():
     """Clean up GPIO resources"""
-    global fb_pwm, lr_pwm
-    
+    global drive_train
+
     try:
-        # Stop PWM
-        if fb_pwm:
-            for pwm in fb_pwm:
-                pwm.stop()
-        if lr_pwm:
-            for pwm in lr_pwm:
-                pwm.stop()
-        
-        gpio.cleanup()
-        print("GPIO cleaned up")
+        if drive_train is not None:
+            drive_train.close()
+            drive_train = None
+            log.info("GPIO cleaned up")
     except Exception as e:
-        print(f"Error during GPIO cleanup: {e}")
+        log.error("Error during GPIO cleanup: %s", e)
 
 # Socket.IO event handlers
 @sio.event
 def connect():
-    print("Connected to Flask server")
+    link_log.info("Connected to Flask server")
     sio.emit("identify", {"user_agent": "Pi"})
     # Setup GPIO after connection
     setup_gpio()
 
 @sio.event
 def disconnect():
-    print("Disconnected from Flask server")
+    link_log.warning("Disconnected from Flask server")
     cleanup_gpio()
 
-@sio.event
-def pi_command(data):
-    print(f"Received command: {data}")
-    
-    # Handle dictionary commands
-    if isinstance(data, dict):
-        throttle = data.get("throttle")
-        turn = data.get("turn")
-        throttle_percent = data.get("throttle_percent", 0)
-        turn_percent = data.get("turn_percent", 0)
-        
-        # Calculate actual speed values (-100 to 100)
-        fb_speed = throttle_percent if throttle == "forward" else -throttle_percent if throttle == "backward" else 0
-        lr_speed = turn_percent if turn == "right" else -turn_percent if turn == "left" else 0
-        
-        # Apply speed control
-        set_forward_backward(fb_speed)
-        set_left_right(lr_speed)
-    
-    # Handle legacy string commands (for backward compatibility)
-    elif isinstance(data, str):
-        if data == "UP pressed":
-            set_forward_backward(100)
-        elif data == "DOWN pressed":
-            set_forward_backward(-100)
-        elif data == "LEFT pressed":
-            set_left_right(-100)
-        elif data == "RIGHT pressed":
-            set_left_right(100)
-        elif data == "UP released" or data == "DOWN released":
-            set_forward_backward(0)
-        elif data == "LEFT released" or data == "RIGHT released":
-            set_left_right(0)
+@sio.on("pi_frame")
+def pi_frame(data):
+    """Apply a control message relayed from the active user, or the server's emergency stop"""
+    apply_frame(data)
+
+@sio.on("pi_heartbeat")
+def pi_heartbeat(seq):
+    """
+    The server's link check while a user holds control, echoed for RTT. It
+    doesn't feed the watchdog: the server keeps sending it while a frozen
+    page holds control, only the driver's own frames prove they are there.
+    """
+    sio.emit("pi_heartbeat_ack", {"seq": seq, "trips": watchdog.trips})
+
+@sio.on("pi_session_start")
+def pi_session_start(data=None):
+    """The server gave control to a new user: seq starts over and an emergency stop is released"""
+    global last_seq, stopped
+
+    with frame_lock:
+        last_seq = None
+        if stopped:
+            stopped = False
+            log.warning("Emergency stop released, new control session")
+
+@sio.on("pi_revoke")
+def pi_revoke(token_id):
+    """Control changed hands, drop the previous user's direct channel"""
+    if direct_control is not None:
+        direct_control.revoke(token_id)
+
+def apply_frame(data):
+    """Apply a control message (see control_frame.py) relayed by the server"""
+    global last_seq, stopped
+
+    frame = decode_frame(data)
+    if frame is None:
+        return
+    kind, throttle, steer, seq, _ = frame
+
+    if kind == STOP:
+        with frame_lock:
+            stopped = True
+            stop_motors()
+        log.warning("EMERGENCY STOP")
+        return
+    if kind != CONTROL:
+        return
+    watchdog.feed()
+
+    with frame_lock:
+        if stopped or (last_seq is not None and not seq_newer(seq, last_seq)):
+            return
+        last_seq = seq
+
+        set_forward_backward(throttle)
+        set_left_right(steer)
+
+def apply_direct_frame(data):
+    """
+    Apply a message from the driver's direct channel. It never passes the
+    server, so only CONTROL is taken from it: stopping the car and
+    releasing a stop are the server's.
+    """
+    frame = decode_frame(data)
+    if frame is None or frame[0] != CONTROL:
+        return
+    apply_frame(data)
+
+def stop_motors():
+    """Stop both motors"""
+    set_forward_backward(0)
+    set_left_right(0)
 
 # Main program
 if __name__ == "__main__":
+    setup_logging()
+    watchdog.start()
     try:
-        print(f"Connecting to Flask server at {SERVER_URL}...")
+        if PI_CONTROL_SECRET:
+            from direct_control import DirectControl
+            direct_control = DirectControl(PI_CONTROL_SECRET, apply_direct_frame, on_close=stop_motors,
+                                           port=DIRECT_CONTROL_PORT)
+            direct_control.start()
+
+        link_log.info("Connecting to Flask server at %s...", SERVER_URL)
         sio.connect(SERVER_URL)
         sio.wait()
     except KeyboardInterrupt:
-        print("Program terminated by user")
+        log.info("Program terminated by user")
     except Exception as e:
-        print(f"Error: {e}")
+        log.error("Error: %s", e)
     finally:
         cleanup_gpio()
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Binary control messages, the one command format between the browser
+(controller.js), the server and the Pi:
+
+    uint8  header     schema version << 4 | message type
+    int8   throttle   -100 to 100
+    int8   steer      -100 to 100
+    uint16 seq        per control session, starts at 0 and wraps
+    uint32 timestamp  sender clock in ms, wraps
+
+little endian, 9 bytes total.
+
+Message types:
+    CONTROL  drive at throttle/steer. Sent by the user in control and
+             relayed untouched by the server (or over the direct channel).
+    STOP     emergency stop from the server. It skips the server's control
+             slot and stops the motors at once, throttle/steer are 0. The
+             car stays stopped until the server starts the next control
+             session (pi_session_start). The Pi drops STOP from the direct
+             channel, users can't send it.
+
+Any message with a different version or size is dropped, so the schema can
+change by bumping VERSION on all three sides.
+"""
+
+import struct
+
+VERSION = 1
+CONTROL = 1
+STOP = 2
+
+FRAME = struct.Struct("<BbbHI")
+FRAME_SIZE = FRAME.size
+
+CONTROL_HEADER = VERSION << 4 | CONTROL
+STOP_HEADER = VERSION << 4 | STOP
+
+
+def decode_frame(data):
+    """Decode a message into (type, throttle, steer, seq, timestamp), or None if malformed"""
+    if len(data) != FRAME_SIZE:
+        return None
+    header, throttle, steer, seq, timestamp = FRAME.unpack(data)
+    if header >> 4 != VERSION:
+        return None
+    return header & 0x0F, throttle, steer, seq, timestamp
+
+
+def encode_frame(throttle, steer, seq, timestamp):
+    """Encode a CONTROL message, mostly useful for testing without a browser"""
+    return FRAME.pack(CONTROL_HEADER, throttle, steer, seq & 0xFFFF, timestamp & 0xFFFFFFFF)
+
+
+def encode_stop(seq=0, timestamp=0):
+    """Encode a STOP message"""
+    return FRAME.pack(STOP_HEADER, 0, 0, seq & 0xFFFF, timestamp & 0xFFFFFFFF)
+
+
+def seq_newer(seq, last_seq):
+    """Check if seq comes after last_seq, allowing for wraparound"""
+    return 0 < ((seq - last_seq) & 0xFFFF) < 0x8000
@@ -0,0 +1,160 @@
+"""
+Direct control path from the browser to the Pi.
+
+Instead of relaying every control frame through the Flask-SocketIO server,
+the active user's browser can open an unordered, no-retransmit WebRTC data
+channel straight to the Pi. The server still decides who drives: it gives
+the active user a signed token (server/SDP051/Server/control_token.py) that
+must come with the WebRTC offer, and tells the Pi to revoke it when control
+changes hands. Frames on the channel use the same binary format as the
+relayed pi_frame events.
+
+Needs aiohttp and aiortc.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+
+from aiohttp import web
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+log = logging.getLogger("car.direct")
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+# A revoked token's id is kept this long. The Pi only gets the id, not the
+# expiry, and a token lives as long as the user's control time, so this
+# has to outlast any control time an admin would set.
+REVOKED_TOKEN_TTL = 24 * 3600
+
+
+def verify_token(secret, token):
+    """Check a token from the server. Returns (token_id, expires) or None"""
+    try:
+        token_id, expires, signature = token.split(".")
+        expires = int(expires)
+    except (AttributeError, ValueError):
+        return None
+
+    payload = f"{token_id}.{expires}"
+    expected = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(signature, expected) or expires <= time.time():
+        return None
+    return token_id, expires
+
+
+class DirectControl:
+    """
+    WebRTC signaling endpoint and data channel for one driver at a time.
+    on_frame(data) is called with every binary frame, and on_close() when
+    the driver's channel goes away, both from the asyncio thread.
+    """
+
+    def __init__(self, secret, on_frame, on_close=None, host="0.0.0.0", port=8081):
+        self.secret = secret
+        self.on_frame = on_frame
+        self.on_close = on_close
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.pc = None  # Peer connection of the current driver
+        self.token_id = None
+        self.used_tokens = {}  # token_id -> expires, tokens only work once
+
+    def start(self):
+        """Run the signaling server in a background thread"""
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), daemon=True).start()
+        ready.wait()
+
+    def revoke(self, token_id=None):
+        """
+        Drop the driver's channel, and keep token_id from being used later
+        if nobody used it yet. Safe to call from any thread.
+        """
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._revoke(token_id), self.loop)
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        app = web.Application()
+        app.router.add_post("/control/offer", self._offer)
+        app.router.add_options("/control/offer", self._preflight)
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, self.host, self.port).start())
+        log.info("Direct control listening on %s:%s", self.host, self.port)
+
+        ready.set()
+        self.loop.run_forever()
+
+    async def _preflight(self, request):
+        return web.Response(headers=CORS_HEADERS)
+
+    async def _offer(self, request):
+        try:
+            params = await request.json()
+        except ValueError:
+            params = None
+        if not isinstance(params, dict) or params.get("type") != "offer" or \
+                not isinstance(params.get("sdp"), str):
+            return web.Response(status=400, headers=CORS_HEADERS)
+        claims = verify_token(self.secret, params.get("token"))
+        if claims is None or claims[0] in self.used_tokens:
+            return web.Response(status=403, headers=CORS_HEADERS)
+        token_id, expires = claims
+
+        now = time.time()
+        self.used_tokens = {t: e for t, e in self.used_tokens.items() if e > now}
+        self.used_tokens[token_id] = expires
+
+        # only one driver at a time
+        await self._revoke()
+
+        pc = RTCPeerConnection()
+        self.pc = pc
+        self.token_id = token_id
+
+        @pc.on("datachannel")
+        def on_datachannel(channel):
+            @channel.on("message")
+            def on_message(message):
+                if isinstance(message, bytes) and self.pc is pc:
+                    self.on_frame(message)
+
+        @pc.on("connectionstatechange")
+        async def on_connectionstatechange():
+            if pc.connectionState in ("failed", "closed") and self.pc is pc:
+                await self._revoke()
+
+        # the token dies with the driver's control time
+        self.loop.call_later(expires - now, lambda: asyncio.ensure_future(self._revoke(token_id)))
+
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=params["sdp"], type=params["type"]))
+        await pc.setLocalDescription(await pc.createAnswer())
+        return web.json_response(
+            {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type},
+            headers=CORS_HEADERS)
+
+    async def _revoke(self, token_id=None):
+        if token_id is not None and token_id not in self.used_tokens:
+            # not used yet, it would still be good until the old user's deadline
+            self.used_tokens[token_id] = time.time() + REVOKED_TOKEN_TTL
+        if self.pc is None or (token_id is not None and token_id != self.token_id):
+            return
+        pc = self.pc
+        self.pc = None
+        self.token_id = None
+        await pc.close()
+        if self.on_close is not None:
+            self.on_close()
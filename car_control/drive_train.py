@@ -0,0 +1,312 @@
+"""
+Drive train of the car: two L298N channels, throttle and steering, each
+driven by a pair of PWM pins.
+
+The PWM itself comes from a backend, so the same code runs on the Pi with
+any of the GPIO libraries used in this repo, or off the Pi with the
+simulated backend:
+
+  rpigpio   RPi.GPIO software PWM, timed by a thread per pin
+  pigpio    pigpio daemon PWM, timed by DMA, needs pigpiod running
+  gpiozero  gpiozero PWMOutputDevice
+  sim       in memory, records every duty cycle change with a timestamp
+  auto      pigpio if pigpiod is running, else rpigpio (the default)
+
+A backend has setup(pin), set_duty(pin, duty) with duty in 0-100 percent,
+and cleanup(). The GPIO libraries are imported when their backend is
+created, not by this module.
+"""
+
+import logging
+import os
+import time
+
+motor_log = logging.getLogger("car.motor")
+
+PWM_FREQ = 100  # PWM frequency in Hz
+
+# Motor control pins (BCM)
+# Left/right pins
+LR_PIN1 = 17  # Left
+LR_PIN2 = 22  # Right
+# Forward/backward pins
+FB_PIN1 = 23  # Forward
+FB_PIN2 = 24  # Backward
+
+
+def speed_to_duty(speed_percent):
+    """
+    Map a -100..100 speed to a PWM duty cycle for its magnitude.
+    Lower duty cycles might not move the motor, so anything but 0 starts at 20%.
+    """
+    abs_speed = abs(speed_percent)
+    if abs_speed > 0:
+        return 20 + (abs_speed * 0.8)  # Scale 0-100 to 20-100
+    return 0
+
+
+def duty_pair(speed_percent):
+    """(positive pin, negative pin) duty cycles for a speed, clamped to -100..100"""
+    speed_percent = max(-100, min(100, speed_percent))
+    duty_cycle = speed_to_duty(speed_percent)
+    # only one pin of the pair may be driven at a time
+    if speed_percent > 0:
+        return duty_cycle, 0
+    if speed_percent < 0:
+        return 0, duty_cycle
+    return 0, 0
+
+
+# Pin duty cycles for every speed a control message can carry (int8), so a
+# decoded throttle or steer value indexes straight into them
+DUTY_PAIRS = tuple(duty_pair(speed) for speed in range(-128, 128))
+
+SPEED_STEP = 5  # controller.js rounds both axes to 5% steps
+
+
+# ====================== BACKENDS ======================
+class RPiGPIOBackend:
+    """Software PWM from RPi.GPIO, one thread per pin"""
+
+    def __init__(self, freq=PWM_FREQ):
+        import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.freq = freq
+        self.pwms = {}
+
+        # Clean up any previous GPIO setup
+        gpio.setwarnings(False)
+        try:
+            gpio.cleanup()
+        except Exception:
+            pass
+        gpio.setmode(gpio.BCM)
+
+    def setup(self, pin):
+        self.gpio.setup(pin, self.gpio.OUT)
+        self.gpio.output(pin, False)
+        pwm = self.gpio.PWM(pin, self.freq)
+        pwm.start(0)
+        self.pwms[pin] = pwm
+
+    def set_duty(self, pin, duty):
+        self.pwms[pin].ChangeDutyCycle(duty)
+
+    def cleanup(self):
+        for pwm in self.pwms.values():
+            pwm.stop()
+        self.pwms.clear()
+        self.gpio.cleanup()
+
+
+class PigpioBackend:
+    """
+    PWM from the pigpio daemon. The pulses are timed by DMA in pigpiod, not
+    by threads in this process, so the camera encoder or the Socket.IO
+    client keeping the CPU busy does not move the edges.
+    """
+
+    def __init__(self, freq=PWM_FREQ):
+        import pigpio
+        self.pigpio = pigpio
+        self.freq = freq
+        self.ranges = {}  # pin -> DMA duty cycle range
+        self.conn = pigpio.pi()
+        if not self.conn.connected:
+            self.conn.stop()  # auto falls back to RPi.GPIO, don't leave the handle behind
+            raise RuntimeError("pigpio daemon not running (start it with: sudo pigpiod)")
+
+    def setup(self, pin):
+        self.conn.set_mode(pin, self.pigpio.OUTPUT)
+        # DMA PWM only has a few frequencies per sample rate, pigpiod picks the closest
+        freq = self.conn.set_PWM_frequency(pin, self.freq)
+        if freq != self.freq:
+            motor_log.warning("pigpio PWM on pin %s runs at %sHz, not %sHz", pin, freq, self.freq)
+        # use every DMA sample of the period as a duty cycle step, no rounding in pigpiod
+        self.ranges[pin] = self.conn.get_PWM_real_range(pin)
+        self.conn.set_PWM_range(pin, self.ranges[pin])
+        self.conn.set_PWM_dutycycle(pin, 0)
+
+    def set_duty(self, pin, duty):
+        self.conn.set_PWM_dutycycle(pin, round(duty * self.ranges[pin] / 100))
+
+    def cleanup(self):
+        for pin in self.ranges:
+            self.conn.set_PWM_dutycycle(pin, 0)
+        self.ranges.clear()
+        self.conn.stop()
+
+
+class GPIOZeroBackend:
+    """PWM from gpiozero PWMOutputDevice"""
+
+    def __init__(self, freq=PWM_FREQ):
+        from gpiozero import PWMOutputDevice
+        self.device = PWMOutputDevice
+        self.freq = freq
+        self.outputs = {}
+
+    def setup(self, pin):
+        self.outputs[pin] = self.device(pin, frequency=self.freq)
+
+    def set_duty(self, pin, duty):
+        self.outputs[pin].value = duty / 100
+
+    def cleanup(self):
+        for output in self.outputs.values():
+            output.close()
+        self.outputs.clear()
+
+
+class SimulatedBackend:
+    """
+    PWM in memory for running off the Pi. Every set_duty call is recorded
+    in `events` as (clock(), pin, duty), and `duty` holds the current duty
+    cycle of each pin.
+    """
+
+    def __init__(self, freq=PWM_FREQ, clock=time.perf_counter):
+        self.freq = freq
+        self.clock = clock
+        self.duty = {}
+        self.events = []
+
+    def setup(self, pin):
+        self.duty[pin] = 0
+
+    def set_duty(self, pin, duty):
+        self.duty[pin] = duty
+        self.events.append((self.clock(), pin, duty))
+
+    def cleanup(self):
+        self.duty.clear()
+
+
+class PWMWriter:
+    """
+    Backend wrapper that remembers the last duty cycle of each pin and only
+    passes real changes on. Every command sets both pins of both channels,
+    but usually only one or two of them change, and on a Pi Zero each
+    RPi.GPIO ChangeDutyCycle call is expensive.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.last = {}  # pin -> duty cycle last written
+
+        # Counters
+        self.writes = 0
+        self.skipped = 0  # Same duty cycle as the pin already has
+
+    def setup(self, pin):
+        self.backend.setup(pin)
+        self.last[pin] = 0  # Every backend starts its pins at 0%
+
+    def set_duty(self, pin, duty):
+        if self.last.get(pin) == duty:
+            self.skipped += 1
+            return
+        self.backend.set_duty(pin, duty)
+        self.last[pin] = duty
+        self.writes += 1
+
+    def cleanup(self):
+        self.backend.cleanup()
+        self.last.clear()
+
+    def stats(self):
+        return {"writes": self.writes, "skipped": self.skipped}
+
+
+BACKENDS = {
+    "rpigpio": RPiGPIOBackend,
+    "pigpio": PigpioBackend,
+    "gpiozero": GPIOZeroBackend,
+    "sim": SimulatedBackend,
+}
+
+
+def make_backend(name=None, freq=PWM_FREQ):
+    """Create a PWM backend by name, default from SDP051_GPIO_BACKEND or auto"""
+    if name is None:
+        name = os.environ.get("SDP051_GPIO_BACKEND", "auto")
+    if name == "auto":
+        try:
+            return PigpioBackend(freq)
+        except (ImportError, RuntimeError) as e:
+            motor_log.warning("Falling back to RPi.GPIO software PWM: %s", e)
+            return RPiGPIOBackend(freq)
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown GPIO backend {name!r}, expected auto or one of: {', '.join(BACKENDS)}")
+    return backend(freq)
+
+
+# ====================== DRIVE TRAIN ======================
+class Motor:
+    """One L298N channel: a positive and a negative PWM pin"""
+
+    def __init__(self, backend, positive_pin, negative_pin):
+        self.backend = backend  # A PWMWriter, or any backend
+        self.positive_pin = positive_pin
+        self.negative_pin = negative_pin
+        self.speed = 0  # -100 to 100
+        backend.setup(positive_pin)
+        backend.setup(negative_pin)
+
+    def set_speed(self, speed_percent):
+        """Returns the duty cycle applied to the active pin"""
+        if type(speed_percent) is int and -128 <= speed_percent < 128:
+            positive, negative = DUTY_PAIRS[speed_percent + 128]
+        else:
+            positive, negative = duty_pair(speed_percent)
+        self.speed = max(-100, min(100, speed_percent))
+
+        self.backend.set_duty(self.positive_pin, positive)
+        self.backend.set_duty(self.negative_pin, negative)
+        return positive or negative
+
+
+class DriveTrain:
+    def __init__(self, backend):
+        self.backend = backend
+        self.writer = PWMWriter(backend)  # Skips writes that change nothing
+        self.throttle = Motor(self.writer, FB_PIN1, FB_PIN2)  # positive is forward
+        self.steering = Motor(self.writer, LR_PIN2, LR_PIN1)  # positive is right
+
+    def set_forward_backward(self, speed_percent):
+        """
+        Set forward/backward movement with speed control
+        speed_percent: -100 to 100, negative for backward, positive for forward
+        """
+        duty_cycle = self.throttle.set_speed(speed_percent)
+        if self.throttle.speed > 0:
+            motor_log.debug("Moving forward at %s%% duty cycle", duty_cycle)
+        elif self.throttle.speed < 0:
+            motor_log.debug("Moving backward at %s%% duty cycle", duty_cycle)
+        else:
+            motor_log.debug("Stopped forward/backward movement")
+
+    def set_left_right(self, speed_percent):
+        """
+        Set left/right turning with speed control
+        speed_percent: -100 to 100, negative for left, positive for right
+        """
+        duty_cycle = self.steering.set_speed(speed_percent)
+        if self.steering.speed > 0:
+            motor_log.debug("Turning right at %s%% duty cycle", duty_cycle)
+        elif self.steering.speed < 0:
+            motor_log.debug("Turning left at %s%% duty cycle", duty_cycle)
+        else:
+            motor_log.debug("Stopped turning")
+
+    def stop(self):
+        """Stop both motors"""
+        self.set_forward_backward(0)
+        self.set_left_right(0)
+
+    def close(self):
+        """Stop the motors and release the GPIO pins"""
+        self.stop()
+        self.writer.cleanup()
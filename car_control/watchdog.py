@@ -0,0 +1,81 @@
+"""
+Dead-man watchdog for the motors.
+
+Every control frame feeds the watchdog, the driver's page resends its
+command as a keepalive even when it doesn't change. When nothing has fed
+it for `timeout` seconds of time.monotonic(), the link is considered
+stalled and the watchdog ramps both channels down to neutral over
+`ramp_time` instead of cutting them, then waits to be fed again. It does
+not restart the motors by itself: after a trip only a new control frame
+moves the car.
+"""
+
+import logging
+import math
+import threading
+import time
+
+from drive_train import SPEED_STEP
+
+link_log = logging.getLogger("car.link")
+
+
+def toward_zero(speed, step):
+    """speed moved `step` closer to 0 without crossing it"""
+    if speed > 0:
+        return max(0, speed - step)
+    if speed < 0:
+        return min(0, speed + step)
+    return 0
+
+
+class Watchdog:
+    def __init__(self, drive, timeout=0.3, ramp_time=0.3, tick=0.02, clock=time.monotonic):
+        self.drive = drive  # Returns the DriveTrain to act on, or None
+        self.timeout = timeout
+        self.tick = tick
+        self.clock = clock
+        # speed change per tick, in the 5% steps the duty table covers, so
+        # full speed reaches neutral within ramp_time
+        self.step = math.ceil(100 * tick / ramp_time / SPEED_STEP) * SPEED_STEP
+        self.lock = threading.Lock()  # Held while feeding or ramping, so a ramp never undoes a fresh frame
+        self.last_fed = clock()
+        self.armed = False  # Fed since the motors were last at neutral
+        self.ramping = False
+        self.trips = 0
+
+    def feed(self):
+        with self.lock:
+            self.last_fed = self.clock()
+            self.armed = True
+            self.ramping = False
+
+    def check(self):
+        """Ramp one step toward neutral if the link is stale. Called every tick."""
+        with self.lock:
+            if not self.armed or self.clock() - self.last_fed < self.timeout:
+                return
+            drive = self.drive()
+            if drive is None:
+                return
+
+            throttle, steering = drive.throttle.speed, drive.steering.speed
+            if (throttle, steering) == (0, 0):
+                self.armed = False
+                self.ramping = False
+                return
+            if not self.ramping:
+                self.trips += 1
+                self.ramping = True
+                link_log.warning("No control for %.0fms, ramping motors to neutral",
+                                 (self.clock() - self.last_fed) * 1000)
+            drive.set_forward_backward(toward_zero(throttle, self.step))
+            drive.set_left_right(toward_zero(steering, self.step))
+
+    def run(self):
+        while True:
+            time.sleep(self.tick)
+            self.check()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
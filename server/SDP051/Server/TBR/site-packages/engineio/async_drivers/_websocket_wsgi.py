@@ -9,6 +9,8 @@ class SimpleWebSocketWSGI:  # pragma: no cover
     def __init__(self, handler, server, **kwargs):
         self.app = handler
         self.server_args = kwargs
+        self.server_args.setdefault('compression',
+                                    server.websocket_compression)
 
     def __call__(self, environ, start_response):
         self.ws = simple_websocket.Server(environ, **self.server_args)
@@ -77,6 +77,12 @@ class AsyncServer(base_server.BaseServer):
     :param transports: The list of allowed transports. Valid transports
                        are ``'polling'`` and ``'websocket'``. Defaults to
                        ``['polling', 'websocket']``.
+    :param packet_trace: Set to ``True`` to count the packets and payload
+                         bytes sent and received per packet type, see
+                         ``packet_trace.stats()``. Set to an integer N to
+                         also log one packet in N. Individual packets are
+                         not logged otherwise. The default is ``None``,
+                         which disables tracing.
     :param kwargs: Reserved for future extensions, any additional parameters
                    given as keyword arguments will be silently ignored.
     """
@@ -34,10 +34,9 @@ class AsyncSocket(base_socket.BaseSocket):
 
     async def receive(self, pkt):
         """Receive packet from the client."""
-        self.server.logger.info('%s: Received packet %s data %s',
-                                self.sid, packet.packet_names[pkt.packet_type],
-                                pkt.data if not isinstance(pkt.data, bytes)
-                                else '<binary>')
+        trace = self.server.packet_trace
+        if trace is not None:
+            trace.received(self.sid, pkt)
         if pkt.packet_type == packet.PONG:
             self.schedule_ping()
         elif pkt.packet_type == packet.MESSAGE:
@@ -74,10 +73,9 @@ class AsyncSocket(base_socket.BaseSocket):
             return
         else:
             await self.queue.put(pkt)
-        self.server.logger.info('%s: Sending packet %s data %s',
-                                self.sid, packet.packet_names[pkt.packet_type],
-                                pkt.data if not isinstance(pkt.data, bytes)
-                                else '<binary>')
+        trace = self.server.packet_trace
+        if trace is not None:
+            trace.sent(self.sid, pkt)
 
     async def handle_get_request(self, environ):
         """Handle a long-polling GET request from the client."""
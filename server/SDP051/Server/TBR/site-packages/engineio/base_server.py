@@ -4,9 +4,11 @@ import importlib
 import io
 import logging
 import secrets
+import threading
 import zlib
 
 from . import packet
+from . import packet_trace as packet_trace_module
 from . import payload
 
 default_logger = logging.getLogger('engineio.server')
@@ -38,6 +40,7 @@ class BaseServer:
                  cookie=None, cors_allowed_origins=None,
                  cors_credentials=True, logger=False, json=None,
                  async_handlers=True, monitor_clients=None, transports=None,
+                 packet_trace=None, websocket_compression=True,
                  **kwargs):
         self.ping_timeout = ping_timeout
         if isinstance(ping_interval, tuple):
@@ -50,6 +53,7 @@ class BaseServer:
         self.allow_upgrades = allow_upgrades
         self.http_compression = http_compression
         self.compression_threshold = compression_threshold
+        self.websocket_compression = websocket_compression
         self.cookie = cookie
         self.cors_allowed_origins = cors_allowed_origins
         self.cors_credentials = cors_credentials
@@ -61,6 +65,8 @@ class BaseServer:
             if monitor_clients is not None else self._default_monitor_clients
         self.service_task_handle = None
         self.service_task_event = None
+        self.ping_scheduler = None
+        self._ping_scheduler_lock = threading.Lock()
         if json is not None:
             packet.Packet.json = json
         if not isinstance(logger, bool):
@@ -73,6 +79,14 @@ class BaseServer:
                 else:
                     self.logger.setLevel(logging.ERROR)
                 self.logger.addHandler(logging.StreamHandler())
+        if isinstance(packet_trace, packet_trace_module.PacketTrace):
+            self.packet_trace = packet_trace
+        elif packet_trace:
+            self.packet_trace = packet_trace_module.PacketTrace(
+                logger=self.logger,
+                log_every=0 if packet_trace is True else int(packet_trace))
+        else:
+            self.packet_trace = None
         modes = self.async_modes()
         if async_mode is not None:
             modes = [async_mode] if async_mode in modes else []
@@ -6,6 +6,7 @@ class BaseSocket:
         self.sid = sid
         self.queue = self.server.create_queue()
         self.last_ping = None
+        self.ping_generation = 0
         self.connected = False
         self.upgrading = False
         self.upgraded = False
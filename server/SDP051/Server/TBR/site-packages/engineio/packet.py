@@ -16,6 +16,7 @@ class Packet:
         self.packet_type = packet_type
         self.data = data
         self.encode_cache = None
+        self.b64_cache = None
         if isinstance(data, str):
             self.binary = False
         elif isinstance(data, binary_types):
@@ -33,23 +34,25 @@ class Packet:
         Note: as a performance optimization, subsequent calls to this method
         will return a cached encoded packet, even if the data has changed.
         """
+        if self.binary:
+            # binary packets are cached per encoding, the same packet can
+            # go to polling (base64) and websocket (raw) clients
+            if not b64:
+                return self.data
+            if self.b64_cache is None:
+                self.b64_cache = 'b' + base64.b64encode(self.data).decode(
+                    'ascii')
+            return self.b64_cache
         if self.encode_cache:
             return self.encode_cache
-        if self.binary:
-            if b64:
-                encoded_packet = 'b' + base64.b64encode(self.data).decode(
-                    'utf-8')
-            else:
-                encoded_packet = self.data
-        else:
-            encoded_packet = str(self.packet_type)
-            if isinstance(self.data, str):
-                encoded_packet += self.data
-            elif isinstance(self.data, dict) or isinstance(self.data, list):
-                encoded_packet += self.json.dumps(self.data,
-                                                  separators=(',', ':'))
-            elif self.data is not None:
-                encoded_packet += str(self.data)
+        encoded_packet = str(self.packet_type)
+        if isinstance(self.data, str):
+            encoded_packet += self.data
+        elif isinstance(self.data, dict) or isinstance(self.data, list):
+            encoded_packet += self.json.dumps(self.data,
+                                              separators=(',', ':'))
+        elif self.data is not None:
+            encoded_packet += str(self.data)
         self.encode_cache = encoded_packet
         return encoded_packet
 
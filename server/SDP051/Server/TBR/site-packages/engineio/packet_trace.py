@@ -0,0 +1,71 @@
+import threading
+
+from . import packet
+
+DIRECTIONS = ('sent', 'received')
+
+
+class PacketTrace:
+    """Count the packets a server sends and receives, per packet type.
+
+    Sockets only call into the trace when the server has one, so with
+    tracing disabled the cost per packet is a single ``None`` check. When
+    enabled, every packet updates a packet and a payload byte counter for
+    its type and direction, and if ``log_every`` is set, one packet in
+    ``log_every`` is also logged with its data.
+
+    :param logger: The logger for sampled packets.
+    :param log_every: Log one packet in this many. ``0`` (the default) only
+                      counts.
+    """
+    def __init__(self, logger=None, log_every=0):
+        self.logger = logger
+        self.log_every = log_every
+        self.lock = threading.Lock()
+        self.seen = 0
+        self.packets = {d: [0] * len(packet.packet_names) for d in DIRECTIONS}
+        self.bytes = {d: [0] * len(packet.packet_names) for d in DIRECTIONS}
+
+    def sent(self, sid, pkt):
+        self._record('sent', sid, pkt)
+
+    def received(self, sid, pkt):
+        self._record('received', sid, pkt)
+
+    def _record(self, direction, sid, pkt):
+        packet_type = pkt.packet_type
+        if not 0 <= packet_type < len(packet.packet_names):
+            return
+        size = payload_size(pkt)
+        with self.lock:
+            self.packets[direction][packet_type] += 1
+            self.bytes[direction][packet_type] += size
+            self.seen += 1
+            sample = self.log_every and self.seen % self.log_every == 0
+        if sample and self.logger:
+            self.logger.info('%s: %s packet %s data %s', sid, direction,
+                             packet.packet_names[packet_type],
+                             pkt.data if not pkt.binary else '<binary>')
+
+    def stats(self):
+        """Packet and payload byte counts, by direction and packet type."""
+        with self.lock:
+            return {
+                direction: {
+                    name: {'packets': self.packets[direction][i],
+                           'bytes': self.bytes[direction][i]}
+                    for i, name in enumerate(packet.packet_names)
+                    if self.packets[direction][i]
+                }
+                for direction in DIRECTIONS
+            }
+
+
+def payload_size(pkt):
+    """Size of a packet's data, without encoding it."""
+    data = pkt.data
+    if data is None:
+        return 0
+    if isinstance(data, (str, bytes, bytearray)):
+        return len(data)
+    return len(pkt.json.dumps(data, separators=(',', ':')))
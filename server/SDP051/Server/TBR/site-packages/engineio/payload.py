@@ -14,11 +14,11 @@ class Payload:
 
     def encode(self, jsonp_index=None):
         """Encode the payload for transmission."""
-        encoded_payload = ''
-        for pkt in self.packets:
-            if encoded_payload:
-                encoded_payload += '\x1e'
-            encoded_payload += pkt.encode(b64=True)
+        # a single join sizes the result once, instead of growing it per
+        # packet, which is quadratic for the large batches a polling client
+        # that was away for a while gets
+        encoded_payload = '\x1e'.join(
+            [pkt.encode(b64=True) for pkt in self.packets])
         if jsonp_index is not None:
             encoded_payload = '___eio[' + \
                               str(jsonp_index) + \
@@ -39,8 +39,15 @@ class Payload:
             encoded_payload = urllib.parse.parse_qs(
                 encoded_payload)['d'][0]
 
-        encoded_packets = encoded_payload.split('\x1e')
-        if len(encoded_packets) > self.max_decode_packets:
-            raise ValueError('Too many packets in payload')
+        # find the separators before splitting, so that a payload with too
+        # many packets is rejected after max_decode_packets of them without
+        # scanning, slicing or decoding the rest
+        separators = 0
+        index = encoded_payload.find('\x1e')
+        while index != -1:
+            separators += 1
+            if separators >= self.max_decode_packets:
+                raise ValueError('Too many packets in payload')
+            index = encoded_payload.find('\x1e', index + 1)
         self.packets = [packet.Packet(encoded_packet=encoded_packet)
-                        for encoded_packet in encoded_packets]
+                        for encoded_packet in encoded_payload.split('\x1e')]
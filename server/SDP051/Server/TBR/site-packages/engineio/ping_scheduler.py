@@ -0,0 +1,82 @@
+import heapq
+import itertools
+import threading
+import time
+
+PING = 0
+TIMEOUT = 1
+
+
+class PingScheduler:
+    """Send the PING packets of all the sockets of a server from one task.
+
+    Each socket has at most one pending deadline in a heap: its next PING,
+    ``ping_interval`` after the last PONG, and once that is sent the end of
+    its ``ping_timeout``. A PONG reschedules the socket, which makes any
+    older entry for it stale; stale entries are skipped when they come up.
+    This keeps the number of threads constant however many clients are
+    connected, instead of a sleeping thread per client.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.heap = []
+        self.lock = threading.Lock()
+        self.counter = itertools.count()  # tie breaker, sockets don't order
+        self.wakeup = None
+        self.task = None
+        self.stopped = False
+
+    def start(self):
+        self.wakeup = self.server.create_event()
+        self.task = self.server.start_background_task(self._run)
+
+    def stop(self):
+        self.stopped = True
+        if self.wakeup:
+            self.wakeup.set()
+        if self.task:
+            self.task.join()
+            self.task = None
+
+    def schedule(self, s):
+        """Ping a socket after the ping interval, dropping what it had."""
+        s.ping_generation += 1
+        self._push(time.monotonic() + self.server.ping_interval, s, PING)
+
+    def pending(self):
+        """Number of heap entries, stale ones included."""
+        with self.lock:
+            return len(self.heap)
+
+    def _push(self, deadline, s, action):
+        entry = (deadline, next(self.counter), s, s.ping_generation, action)
+        with self.lock:
+            heapq.heappush(self.heap, entry)
+            earliest = self.heap[0] is entry
+        if earliest and self.wakeup:
+            self.wakeup.set()
+
+    def _run(self):
+        while not self.stopped:
+            now = time.monotonic()
+            due = []
+            with self.lock:
+                while self.heap and self.heap[0][0] <= now:
+                    due.append(heapq.heappop(self.heap))
+                timeout = self.heap[0][0] - now if self.heap else None
+            for _, _, s, generation, action in due:
+                if generation != s.ping_generation or s.closing or s.closed:
+                    continue
+                try:
+                    if action == PING:
+                        s._send_ping()
+                        self._push(now + self.server.ping_timeout, s, TIMEOUT)
+                    else:
+                        # no PONG since the last PING
+                        s._ping_timeout()
+                except Exception:  # pragma: no cover
+                    self.server.logger.exception('ping scheduler exception')
+            if due:
+                continue  # the work took time, look at the heap again
+            self.wakeup.wait(timeout=timeout)
+            self.wakeup.clear()
@@ -4,6 +4,7 @@ import urllib
 from . import base_server
 from . import exceptions
 from . import packet
+from . import ping_scheduler
 from . import socket
 
 default_logger = logging.getLogger('engineio.server')
@@ -77,6 +78,22 @@ class Server(base_server.BaseServer):
     :param transports: The list of allowed transports. Valid transports
                        are ``'polling'`` and ``'websocket'``. Defaults to
                        ``['polling', 'websocket']``.
+    :param packet_trace: Set to ``True`` to count the packets and payload
+                         bytes sent and received per packet type, see
+                         ``packet_trace.stats()``. Set to an integer N to
+                         also log one packet in N. Individual packets are
+                         not logged otherwise. The default is ``None``,
+                         which disables tracing.
+    :param websocket_compression: The permessage-deflate policy for
+                                  WebSocket connections served by
+                                  simple-websocket, as in the ``threading``
+                                  async mode. ``True`` (the default)
+                                  compresses every message when the client
+                                  supports it, ``False`` disables
+                                  compression. A
+                                  ``simple_websocket.Compression`` instance
+                                  compresses selected messages only and
+                                  reports what compression costs.
     :param kwargs: Reserved for future extensions, any additional parameters
                    given as keyword arguments will be silently ignored.
     """
@@ -348,6 +365,9 @@ class Server(base_server.BaseServer):
             self.service_task_event.set()
             self.service_task_handle.join()
             self.service_task_handle = None
+        if self.ping_scheduler:
+            self.ping_scheduler.stop()
+            self.ping_scheduler = None
 
     def start_background_task(self, target, *args, **kwargs):
         """Start a background task using the appropriate async model.
@@ -378,6 +398,15 @@ class Server(base_server.BaseServer):
         """
         return self._async['sleep'](seconds)
 
+    def _get_ping_scheduler(self):
+        """Return the scheduler that pings all the clients, starting it on
+        first use."""
+        with self._ping_scheduler_lock:
+            if self.ping_scheduler is None:
+                self.ping_scheduler = ping_scheduler.PingScheduler(self)
+                self.ping_scheduler.start()
+            return self.ping_scheduler
+
     def _handle_connect(self, environ, start_response, transport,
                         jsonp_index=None):
         """Handle a client connection request."""
@@ -34,12 +34,9 @@ class Socket(base_socket.BaseSocket):
 
     def receive(self, pkt):
         """Receive packet from the client."""
-        packet_name = packet.packet_names[pkt.packet_type] \
-            if pkt.packet_type < len(packet.packet_names) else 'UNKNOWN'
-        self.server.logger.info('%s: Received packet %s data %s',
-                                self.sid, packet_name,
-                                pkt.data if not isinstance(pkt.data, bytes)
-                                else '<binary>')
+        trace = self.server.packet_trace
+        if trace is not None:
+            trace.received(self.sid, pkt)
         if pkt.packet_type == packet.PONG:
             self.schedule_ping()
         elif pkt.packet_type == packet.MESSAGE:
@@ -59,26 +56,28 @@ class Socket(base_socket.BaseSocket):
             raise exceptions.SocketIsClosedError()
         if self.last_ping and \
                 time.time() - self.last_ping > self.server.ping_timeout:
-            self.server.logger.info('%s: Client is gone, closing socket',
-                                    self.sid)
-            # Passing abort=False here will cause close() to write a
-            # CLOSE packet. This has the effect of updating half-open sockets
-            # to their correct state of disconnected
-            self.close(wait=False, abort=False,
-                       reason=self.server.reason.PING_TIMEOUT)
+            self._ping_timeout()
             return False
         return True
 
+    def _ping_timeout(self):
+        self.server.logger.info('%s: Client is gone, closing socket',
+                                self.sid)
+        # Passing abort=False here will cause close() to write a
+        # CLOSE packet. This has the effect of updating half-open sockets
+        # to their correct state of disconnected
+        self.close(wait=False, abort=False,
+                   reason=self.server.reason.PING_TIMEOUT)
+
     def send(self, pkt):
         """Send a packet to the client."""
         if not self.check_ping_timeout():
             return
         else:
             self.queue.put(pkt)
-        self.server.logger.info('%s: Sending packet %s data %s',
-                                self.sid, packet.packet_names[pkt.packet_type],
-                                pkt.data if not isinstance(pkt.data, bytes)
-                                else '<binary>')
+        trace = self.server.packet_trace
+        if trace is not None:
+            trace.sent(self.sid, pkt)
 
     def handle_get_request(self, environ, start_response):
         """Handle a long-polling GET request from the client."""
@@ -130,11 +129,10 @@ class Socket(base_socket.BaseSocket):
                 self.queue.join()
 
     def schedule_ping(self):
-        self.server.start_background_task(self._send_ping)
+        self.last_ping = None
+        self.server._get_ping_scheduler().schedule(self)
 
     def _send_ping(self):
-        self.last_ping = None
-        self.server.sleep(self.server.ping_interval)
         if not self.closing and not self.closed:
             self.last_ping = time.time()
             self.send(packet.Packet(packet.PING))
@@ -1,3 +1,4 @@
 from .ws import Server, Client  # noqa: F401
 from .aiows import AioServer, AioClient  # noqa: F401
+from .compression import Compression  # noqa: F401
 from .errors import ConnectionError, ConnectionClosed  # noqa: F401
@@ -0,0 +1,166 @@
+import threading
+import weakref
+from time import thread_time
+
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import Opcode
+
+# zlib's documented memory use: deflate needs (1 << (windowBits + 2)) plus
+# (1 << (memLevel + 9)) bytes, inflate (1 << windowBits) plus about 7 KB
+DEFLATE_MEM_LEVEL = 8
+INFLATE_OVERHEAD = 7 * 1024
+
+
+class Compression:
+    """A permessage-deflate policy shared by the connections of a server.
+
+    Pass an instance as the ``compression`` argument of ``Server`` to decide
+    which outgoing messages are compressed, instead of compressing all of
+    them. Messages below ``threshold`` go out uncompressed, and never make
+    the connection allocate a compressor.
+
+    :param threshold: Only compress messages of at least this many bytes.
+                      The default is 0, which compresses every message.
+    :param message_filter: A function that receives the data of an outgoing
+                           message above the threshold and returns ``True``
+                           to compress it. The default is ``None``, which
+                           compresses them all.
+    :param window_bits: The deflate window size, as a power of two, between
+                        9 and 15. Smaller windows use less memory per
+                        connection and compress less. The default is 15.
+    :param context_takeover: Whether both sides keep their deflate state
+                             from one message to the next. The default is
+                             ``False``: every message is compressed on its
+                             own, so an idle connection holds no zlib
+                             state at all.
+    """
+    def __init__(self, threshold=0, message_filter=None, window_bits=15,
+                 context_takeover=False):
+        if window_bits < 9 or window_bits > 15:
+            raise ValueError('Window size must be between 9 and 15 inclusive')
+        self.threshold = threshold
+        self.message_filter = message_filter
+        self.window_bits = window_bits
+        self.context_takeover = context_takeover
+        self.lock = threading.Lock()
+        self.connections = weakref.WeakSet()
+
+    def should_compress(self, data):
+        if len(data) < self.threshold:
+            return False
+        return self.message_filter is None or self.message_filter(data)
+
+    def extension(self):
+        """A new extension for one connection."""
+        extension = SelectiveDeflate(self)
+        with self.lock:
+            self.connections.add(extension)
+        return extension
+
+    def stats(self):
+        """Totals over the open connections that negotiated compression.
+
+        ``memory`` is the zlib state the connections hold right now, in
+        bytes, and ``cpu`` the thread CPU seconds they spent compressing
+        and decompressing.
+        """
+        with self.lock:
+            extensions = [e for e in self.connections if e.enabled()]
+        totals = {'connections': len(extensions), 'compressors': 0,
+                  'decompressors': 0, 'memory': 0, 'cpu': 0.0,
+                  'compressed': 0, 'skipped': 0, 'decompressed': 0,
+                  'bytes_in': 0, 'bytes_out': 0}
+        for extension in extensions:
+            for key, value in extension.stats().items():
+                totals[key] += value
+        if extensions:
+            totals['memory_per_connection'] = \
+                totals['memory'] / len(extensions)
+            totals['cpu_per_connection'] = totals['cpu'] / len(extensions)
+        return totals
+
+
+class SelectiveDeflate(PerMessageDeflate):
+    """permessage-deflate that leaves the messages a policy rejects alone.
+
+    The decision is taken on the first frame of a message and carried to
+    its continuation frames. A message sent without the RSV1 bit is valid
+    on a connection that negotiated compression, so the client needs no
+    special handling.
+    """
+    def __init__(self, policy):
+        no_context_takeover = not policy.context_takeover
+        super().__init__(client_no_context_takeover=no_context_takeover,
+                         client_max_window_bits=policy.window_bits,
+                         server_no_context_takeover=no_context_takeover,
+                         server_max_window_bits=policy.window_bits)
+        self.policy = policy
+        self._outbound_compressed = False
+        self.cpu = 0.0
+        self.compressed = 0
+        self.skipped = 0
+        self.decompressed = 0
+        self.bytes_in = 0  # uncompressed size of the compressed messages
+        self.bytes_out = 0  # their compressed size
+
+    def accept(self, offer):
+        if 'client_max_window_bits' not in offer:
+            # the client can only be held to a smaller window if it offered
+            # one, this side must then inflate with the full window
+            self.client_max_window_bits = self.DEFAULT_CLIENT_MAX_WINDOW_BITS
+        return super().accept(offer)
+
+    def frame_outbound(self, proto, opcode, rsv, data, fin):
+        if not self._compressible_opcode(opcode):
+            return (rsv, data)
+        if opcode is not Opcode.CONTINUATION:
+            self._outbound_compressed = self.policy.should_compress(data)
+        if not self._outbound_compressed:
+            if fin:
+                self.skipped += 1
+            return (rsv, data)
+        start = thread_time()
+        rsv, compressed = super().frame_outbound(proto, opcode, rsv, data,
+                                                 fin)
+        self.cpu += thread_time() - start
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        if fin:
+            self.compressed += 1
+        return (rsv, compressed)
+
+    def frame_inbound_payload_data(self, proto, data):
+        if not self._inbound_compressed:
+            return super().frame_inbound_payload_data(proto, data)
+        start = thread_time()
+        data = super().frame_inbound_payload_data(proto, data)
+        self.cpu += thread_time() - start
+        return data
+
+    def frame_inbound_complete(self, proto, fin):
+        if not (self._inbound_compressed and self._inbound_is_compressible):
+            return super().frame_inbound_complete(proto, fin)
+        start = thread_time()
+        data = super().frame_inbound_complete(proto, fin)
+        self.cpu += thread_time() - start
+        if fin:
+            self.decompressed += 1
+        return data
+
+    def memory(self):
+        """Estimated bytes of zlib state this connection holds."""
+        size = 0
+        if self._compressor is not None:
+            size += (1 << (self.server_max_window_bits + 2)) + \
+                (1 << (DEFLATE_MEM_LEVEL + 9))
+        if self._decompressor is not None:
+            size += (1 << self.client_max_window_bits) + INFLATE_OVERHEAD
+        return size
+
+    def stats(self):
+        return {'compressors': int(self._compressor is not None),
+                'decompressors': int(self._decompressor is not None),
+                'memory': self.memory(), 'cpu': self.cpu,
+                'compressed': self.compressed, 'skipped': self.skipped,
+                'decompressed': self.decompressed,
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
@@ -19,13 +19,15 @@ from wsproto.events import (
 from wsproto.extensions import PerMessageDeflate
 from wsproto.frame_protocol import CloseReason
 from wsproto.utilities import LocalProtocolError
+from .compression import Compression
 from .errors import ConnectionError, ConnectionClosed
 
 
 class Base:
     def __init__(self, sock=None, connection_type=None, receive_bytes=4096,
                  ping_interval=None, max_message_size=None,
-                 thread_class=None, event_class=None, selector_class=None):
+                 thread_class=None, event_class=None, selector_class=None,
+                 compression=True):
         #: The name of the subprotocol chosen for the WebSocket connection.
         self.subprotocol = None
 
@@ -41,6 +43,7 @@ class Base:
         self.is_server = (connection_type == ConnectionType.SERVER)
         self.close_reason = CloseReason.NO_STATUS_RCVD
         self.close_message = None
+        self.compression = compression
 
         if thread_class is None:
             import threading
@@ -165,6 +168,13 @@ class Base:
         sel.close() if sel else None
         self.sock.close()
 
+    def _extensions(self):
+        if isinstance(self.compression, Compression):
+            return [self.compression.extension()]
+        elif self.compression:
+            return [PerMessageDeflate()]
+        return []
+
     def _handle_events(self):
         keep_going = True
         out_data = b''
@@ -174,7 +184,7 @@ class Base:
                     self.subprotocol = self.choose_subprotocol(event)
                     out_data += self.ws.send(AcceptConnection(
                         subprotocol=self.subprotocol,
-                        extensions=[PerMessageDeflate()]))
+                        extensions=self._extensions()))
                 elif isinstance(event, CloseConnection):
                     if self.is_server:
                         out_data += self.ws.send(event.response())
@@ -254,7 +264,7 @@ class Server(Base):
     """
     def __init__(self, environ, subprotocols=None, receive_bytes=4096,
                  ping_interval=None, max_message_size=None, thread_class=None,
-                 event_class=None, selector_class=None):
+                 event_class=None, selector_class=None, compression=True):
         self.environ = environ
         self.subprotocols = subprotocols or []
         if isinstance(self.subprotocols, str):
@@ -293,12 +303,13 @@ class Server(Base):
                          ping_interval=ping_interval,
                          max_message_size=max_message_size,
                          thread_class=thread_class, event_class=event_class,
-                         selector_class=selector_class)
+                         selector_class=selector_class,
+                         compression=compression)
 
     @classmethod
     def accept(cls, environ, subprotocols=None, receive_bytes=4096,
                ping_interval=None, max_message_size=None, thread_class=None,
-               event_class=None, selector_class=None):
+               event_class=None, selector_class=None, compression=True):
         """Accept a WebSocket connection from a client.
 
         :param environ: A WSGI ``environ`` dictionary with the request details.
@@ -334,12 +345,20 @@ class Server(Base):
                                selectors. The default is the
                                ``selectors.DefaultSelector`` class from the
                                Python standard library.
+        :param compression: Whether to accept the permessage-deflate
+                            extension when the client offers it. ``True``
+                            (the default) compresses every message, and
+                            ``False`` leaves all messages uncompressed. Pass
+                            a ``Compression`` instance to compress only some
+                            messages, e.g. those above a size threshold, and
+                            to get the memory and CPU the connections spend
+                            on compression from its ``stats()`` method.
         """
         return cls(environ, subprotocols=subprotocols,
                    receive_bytes=receive_bytes, ping_interval=ping_interval,
                    max_message_size=max_message_size,
                    thread_class=thread_class, event_class=event_class,
-                   selector_class=selector_class)
+                   selector_class=selector_class, compression=compression)
 
     def handshake(self):
         in_data = b'GET / HTTP/1.1\r\n'
@@ -0,0 +1,221 @@
+"""
+Asyncio version of the control server.
+
+Same pages, same Socket.IO events and the same ControlService as
+server.py, but served as an ASGI app on one event loop: a queued visitor
+is a socket on the loop rather than a thread, so thousands of idle
+connections fit on one core.
+
+    uvicorn async_server:app --host 0.0.0.0 --port 4000
+    python async_server.py
+
+Needs an ASGI server (uvicorn) on top of the vendored packages.
+"""
+
+import asyncio
+import os
+import time
+from urllib.parse import parse_qs
+
+import socketio
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from control_service import (ADMIN_PASSWORD, ADMIN_USERNAME, EVENTS, HEARTBEAT_INTERVAL, PACKET_TRACE, TIMER_TICK,
+                             ControlService)
+from logs import get_logger, setup_logging
+
+log_ring = setup_logging()  # Recent log lines, served to admins
+admin_log = get_logger("admin")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+
+SECRET_KEY = "SDP051secretkey"  # Same key as server.py
+ADMIN_COOKIE = "can_access_admin"
+ADMIN_COOKIE_MAX_AGE = 60  # Seconds between a login and opening /admin
+
+# Several processes sharing a queue (SDP051_QUEUE_DB) reach each other's
+# sockets through Redis, see server.py
+MESSAGE_QUEUE = os.environ.get("SDP051_MESSAGE_QUEUE")
+sio = socketio.AsyncServer(async_mode="asgi",
+                           client_manager=socketio.AsyncRedisManager(MESSAGE_QUEUE) if MESSAGE_QUEUE else None,
+                           packet_trace=PACKET_TRACE)
+signer = URLSafeTimedSerializer(SECRET_KEY, salt="admin")
+
+# ControlService is synchronous, so its emits are queued here in order and
+# sent by a single task. Order matters: an admin must join ADMIN_ROOM
+# before the first broadcast to that room goes out.
+outbox = asyncio.Queue()
+
+service = ControlService(
+    send=lambda event, data, to: outbox.put_nowait(("emit", event, data, to)),
+    join=lambda sid, room: outbox.put_nowait(("join", sid, room)),
+    log_ring=log_ring,
+    packet_trace=sio.eio.packet_trace,
+)
+
+
+async def outbox_sender():
+    """Background task sending what the service queued"""
+    while True:
+        item = await outbox.get()
+        try:
+            if item[0] == "emit":
+                _, event, data, to = item
+                await sio.emit(event, data, to=to)
+            else:
+                _, sid, room = item
+                await sio.enter_room(sid, room)
+        except Exception:
+            admin_log.exception("Failed to send %s", item[1])
+
+
+async def session_timer():
+    """Background task ending control sessions when their time is up"""
+    while True:
+        await asyncio.sleep(TIMER_TICK)
+        service.check_session(time.monotonic())
+
+
+async def control_flusher():
+    """Background task sending frames held back by the control rate limit"""
+    while True:
+        await asyncio.sleep(service.control_slot.interval)
+        service.flush_control(time.monotonic())
+
+
+async def heartbeat():
+    """Background task timing round trips to the Pi while a user holds control"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        service.send_heartbeat(time.monotonic())
+
+
+def start_background_tasks():
+    """Start the outbox sender, the session timer, the control flusher and the heartbeat"""
+    sio.start_background_task(outbox_sender)
+    sio.start_background_task(session_timer)
+    sio.start_background_task(control_flusher)
+    sio.start_background_task(heartbeat)
+
+
+# ====================== SOCKET.IO EVENTS ======================
+def event_handler(method):
+    """
+    Socket.IO handler calling a ControlService method. The handlers are plain
+    functions, so they run on the loop without a task per event.
+    """
+    def handler(sid, *args):
+        method(sid, *args[:1])
+    return handler
+
+
+for event, method in EVENTS.items():
+    if event == "connect":
+        # connect gets (sid, environ, auth), the service only needs the sid
+        sio.on(event, lambda sid, environ, auth=None: service.on_connect(sid))
+    else:
+        sio.on(event, event_handler(getattr(service, method)))
+
+
+# ====================== ROUTES ======================
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def respond(send, status, body=b"", headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/html; charset=utf-8"), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def redirect(location, *headers):
+    return 302, b"", [(b"location", location.encode()), *headers]
+
+
+def render(name):
+    with open(os.path.join(TEMPLATES_DIR, name), "rb") as f:
+        return 200, f.read(), []
+
+
+def get_cookie(scope, name):
+    for key, value in scope["headers"]:
+        if key == b"cookie":
+            for part in value.decode("latin-1").split(";"):
+                cookie_name, _, cookie_value = part.strip().partition("=")
+                if cookie_name == name:
+                    return cookie_value
+    return None
+
+
+def login(scope, body):
+    """Handle admin login"""
+    if scope["method"] == "POST":
+        form = parse_qs(body.decode())
+        username = form.get("username", [None])[0]
+        password = form.get("password", [None])[0]
+
+        admin_log.info("Login attempt: %s", username)
+
+        if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
+            cookie = f"{ADMIN_COOKIE}={signer.dumps(True)}; Path=/; HttpOnly; Max-Age={ADMIN_COOKIE_MAX_AGE}"
+            return redirect("/admin", (b"set-cookie", cookie.encode()))
+
+    return render("login.html")
+
+
+def admin(scope, body):
+    """Serve the admin control panel"""
+    token = get_cookie(scope, ADMIN_COOKIE)
+    try:
+        signer.loads(token or "", max_age=ADMIN_COOKIE_MAX_AGE)
+    except BadSignature:
+        return redirect("/login")
+
+    # one login, one visit, like server.py
+    status, body, _ = render("admin.html")
+    return status, body, [(b"set-cookie", f"{ADMIN_COOKIE}=; Path=/; Max-Age=0".encode())]
+
+
+ROUTES = {
+    "/login": login,
+    "/admin": admin,
+}
+
+
+async def http_app(scope, receive, send):
+    """Pages that need more than a static file"""
+    if scope["type"] != "http":
+        return
+    body = await read_body(receive)
+    route = ROUTES.get(scope["path"])
+    if route is None:
+        await respond(send, 404, b"Not Found")
+        return
+    status, body, headers = route(scope, body)
+    await respond(send, status, body, headers)
+
+
+def static_files():
+    """Static file table for ASGIApp: the controller page plus everything in static/"""
+    files = {"/": os.path.join(TEMPLATES_DIR, "index.html")}
+    for root, _, names in os.walk(STATIC_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            files["/" + os.path.relpath(path, STATIC_DIR).replace(os.sep, "/")] = path
+    return files
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, static_files=static_files(),
+                       on_startup=start_background_tasks)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=4000)
@@ -0,0 +1,129 @@
+"""
+Loopback benchmark of the two control paths:
+
+  relay   browser -> Flask-SocketIO server (server.py) -> Pi, over Socket.IO
+  direct  browser -> Pi, over the WebRTC data channel (direct_control.py)
+
+Both ends run in this process on 127.0.0.1, so the numbers are the cost of
+the software path itself, not the network. Frames are paced at the
+server's CONTROL_RATE_HZ, each one sent after the previous one arrived,
+and the send-to-receive time is recorded.
+
+Needs python-socketio[client], aiohttp and aiortc.
+
+    python bench_control_path.py [frames]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "car_control"))
+
+import socketio
+from aiohttp import ClientSession
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+from control_frame import encode_frame
+from control_token import issue_token
+
+RELAY_PORT = 4100
+DIRECT_PORT = 8181
+SECRET = "bench-secret"
+FRAME_INTERVAL = 1 / 50  # Matches server.CONTROL_RATE_HZ
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    def pct(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000
+    print(f"{name:>6}: n={len(samples)} mean={statistics.mean(samples) * 1000:.3f}ms "
+          f"p50={pct(50):.3f}ms p90={pct(90):.3f}ms p99={pct(99):.3f}ms max={samples[-1] * 1000:.3f}ms")
+
+
+def bench_relay(frames):
+    import server
+
+    server.start_background_tasks()
+    threading.Thread(target=server.socketio.run, args=(server.app,),
+                     kwargs={"host": "127.0.0.1", "port": RELAY_PORT, "allow_unsafe_werkzeug": True},
+                     daemon=True).start()
+    time.sleep(1)
+    url = f"http://127.0.0.1:{RELAY_PORT}"
+
+    received = threading.Event()
+    pi = socketio.Client()
+    pi.on("pi_frame", lambda data: received.set())
+    pi.connect(url, transports=["websocket"])
+    pi.emit("identify", {"user_agent": "Pi"})
+
+    has_control = threading.Event()
+    user = socketio.Client()
+    user.on("timestart", lambda time_allowed: has_control.set())
+    user.connect(url, transports=["websocket"])
+    user.emit("userRequestAdd", {})
+    has_control.wait(5)
+
+    samples = []
+    for seq in range(frames):
+        received.clear()
+        start = time.perf_counter()
+        user.emit("controlFrame", encode_frame(seq % 100, -(seq % 100), seq, 0))
+        if received.wait(1):
+            samples.append(time.perf_counter() - start)
+        time.sleep(max(0.0, start + FRAME_INTERVAL - time.perf_counter()))
+    print(f"control slot: {server.service.control_slot.stats()}")
+
+    user.disconnect()
+    pi.disconnect()
+    return samples
+
+
+async def bench_direct(frames):
+    from direct_control import DirectControl
+
+    loop = asyncio.get_running_loop()
+    received = asyncio.Event()
+    direct = DirectControl(SECRET, lambda data: loop.call_soon_threadsafe(received.set),
+                           host="127.0.0.1", port=DIRECT_PORT)
+    direct.start()
+
+    pc = RTCPeerConnection()
+    channel = pc.createDataChannel("control", ordered=False, maxRetransmits=0)
+    opened = asyncio.Event()
+    channel.on("open", opened.set)
+
+    # aiortc gathers every candidate before setLocalDescription returns
+    await pc.setLocalDescription(await pc.createOffer())
+    _, token = issue_token(SECRET, 60)
+    async with ClientSession() as session:
+        async with session.post(f"http://127.0.0.1:{DIRECT_PORT}/control/offer", json={
+                "sdp": pc.localDescription.sdp, "type": pc.localDescription.type, "token": token}) as response:
+            answer = await response.json()
+    await pc.setRemoteDescription(RTCSessionDescription(sdp=answer["sdp"], type=answer["type"]))
+    await asyncio.wait_for(opened.wait(), 10)
+
+    samples = []
+    for seq in range(frames):
+        received.clear()
+        start = time.perf_counter()
+        channel.send(encode_frame(seq % 100, -(seq % 100), seq, 0))
+        try:
+            await asyncio.wait_for(received.wait(), 1)
+            samples.append(time.perf_counter() - start)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(max(0.0, start + FRAME_INTERVAL - time.perf_counter()))
+
+    await pc.close()
+    direct.revoke()
+    return samples
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    report("relay", bench_relay(frames))
+    report("direct", asyncio.run(bench_direct(frames)))
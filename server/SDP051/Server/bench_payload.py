@@ -0,0 +1,110 @@
+"""
+Engine.IO long-polling payload encode/decode.
+
+A client whose WebSocket keeps dropping on venue Wi-Fi falls back to
+long-polling. After each gap an admin panel's next poll carries everything
+queued meanwhile: adminQueuePatch updates, a handover's timestart, the odd
+full queue snapshot. The driver's POSTs carry their controlFrame events, a
+placeholder packet plus the 9 byte frame each. This times encoding such
+batches, decoding the driver's POSTs, and rejecting a POST with far more
+packets than max_decode_packets, against the encoder and decoder engineio
+had before.
+
+    python bench_payload.py [--batches 10 100 1000 10000]
+"""
+
+import argparse
+import time
+
+from engineio import packet, payload
+
+
+def legacy_encode(packets):
+    """engineio's original encoder, growing the string per packet"""
+    encoded_payload = ""
+    for pkt in packets:
+        if encoded_payload:
+            encoded_payload += "\x1e"
+        encoded_payload += pkt.encode(b64=True)
+    return encoded_payload
+
+
+def legacy_decode(encoded_payload):
+    """engineio's original decoder, splitting everything before checking"""
+    encoded_packets = encoded_payload.split("\x1e")
+    if len(encoded_packets) > payload.Payload.max_decode_packets:
+        raise ValueError("Too many packets in payload")
+    return [packet.Packet(encoded_packet=p) for p in encoded_packets]
+
+
+PATCH = '2["adminQueuePatch",{"seq":%d,"ops":[{"op":"update","sid":"h3Kx9bQ2Aa0001","fields":{"timeRemaining":%d}}]}]'
+SNAPSHOT = '2["adminResponseQueue",{"seq":%d,"queue":[%s],"current_index":0}]'
+USER = '{"sid":"h3Kx9bQ2Aa%04d","timeAllowed":90,"timeRemaining":90}'
+CONTROL_EVENT = '51-["controlFrame",{"_placeholder":true,"num":0}]'
+CONTROL = bytes([0x11, 0, 0, 0x7F, 0, 0x40, 0, 0, 1])  # control_frame.py layout
+
+
+def backlog(count):
+    """What piles up for a polling admin panel: mostly patches, a timestart every 20th, a snapshot every 50th"""
+    snapshot = SNAPSHOT % (0, ",".join(USER % i for i in range(20)))
+    packets = []
+    for i in range(count):
+        if i % 50 == 49:
+            packets.append(packet.Packet(packet.MESSAGE, data=snapshot))
+        elif i % 20 == 19:
+            packets.append(packet.Packet(packet.MESSAGE, data='2["timestart",90]'))
+        else:
+            packets.append(packet.Packet(packet.MESSAGE, data=PATCH % (i, 90 - i % 90)))
+    return packets
+
+
+def control_post(count):
+    """The driver's POST: controlFrame events, each a placeholder packet and its binary attachment"""
+    packets = []
+    for _ in range(count // 2):
+        packets.append(packet.Packet(packet.MESSAGE, data=CONTROL_EVENT))
+        packets.append(packet.Packet(packet.MESSAGE, data=CONTROL))
+    return packets
+
+
+def timed(fn, setup=lambda: None, repeat=5):
+    """Best of repeat runs of fn(setup()), in ms, setup untimed"""
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batches", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    print("encode (ms, fresh packets so per-packet encoding is included)")
+    for count in args.batches:
+        old = timed(legacy_encode, lambda: backlog(count))
+        new = timed(lambda packets: payload.Payload(packets=packets).encode(), lambda: backlog(count))
+        print(f"  {count:6d} packets: before {old:8.3f}  after {new:8.3f}")
+
+    print("decode (ms)")
+    post = "\x1e".join(p.encode(b64=True) for p in control_post(payload.Payload.max_decode_packets))
+    print(f"  {payload.Payload.max_decode_packets} packet POST: before {timed(legacy_decode, lambda: post):8.3f}  "
+          f"after {timed(lambda p: payload.Payload(encoded_payload=p), lambda: post):8.3f}")
+    flood = "\x1e".join(["4x"] * 200000)
+
+    def rejecting(decode):
+        def run(body):
+            try:
+                decode(body)
+            except ValueError:
+                pass
+        return run
+    print(f"  200k packet POST (rejected): before {timed(rejecting(legacy_decode), lambda: flood):8.3f}  "
+          f"after {timed(rejecting(lambda p: payload.Payload(encoded_payload=p)), lambda: flood):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Engine.IO keepalive cost with many idle clients, threading mode.
+
+Connects N Engine.IO sockets straight through the server's request
+handler (no HTTP) and answers every PING with a PONG from one responder
+thread, like idle queue visitors. Runs for a few ping cycles and reports
+the peak thread count, RSS, pings answered and sockets closed by ping
+timeout. --legacy puts back the old keepalive (a background thread per
+socket per ping cycle) to compare against the shared ping scheduler.
+
+    python bench_ping_scheduler.py [--clients 1000 5000] [--cycles 5] [--legacy]
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import engineio
+from engineio import packet, socket
+
+PING_INTERVAL = 0.5
+PING_TIMEOUT = 2
+
+
+def legacy_schedule_ping(self):
+    """engineio's original keepalive, one thread sleeping per socket"""
+    def send_ping():
+        self.last_ping = None
+        self.server.sleep(self.server.ping_interval)
+        self._send_ping()
+    self.last_ping = None
+    self.server.start_background_task(send_ping)
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def connect(server, count):
+    environ = {"REQUEST_METHOD": "GET", "QUERY_STRING": "EIO=4&transport=polling"}
+    for _ in range(count):
+        server.handle_request(dict(environ), lambda status, headers: None)
+    return list(server.sockets.values())
+
+
+def respond(sockets, stop, counts):
+    """Answer PINGs with PONGs, the way idle clients do"""
+    while not stop.is_set():
+        for s in sockets:
+            while not s.queue.empty():
+                pkt = s.queue.get_nowait()
+                s.queue.task_done()
+                if pkt is not None and pkt.packet_type == packet.PING:
+                    counts["pings"] += 1
+                    s.receive(packet.Packet(packet.PONG))
+        time.sleep(0.01)
+
+
+def run(clients, cycles, legacy):
+    server = engineio.Server(async_mode="threading", ping_interval=PING_INTERVAL,
+                             ping_timeout=PING_TIMEOUT, monitor_clients=False, logger=False)
+    if legacy:
+        socket.Socket.schedule_ping = legacy_schedule_ping
+    base_threads = threading.active_count()
+    sockets = connect(server, clients)
+
+    stop = threading.Event()
+    counts = {"pings": 0}
+    responder = threading.Thread(target=respond, args=(sockets, stop, counts), daemon=True)
+    responder.start()
+
+    peak_threads = 0
+    end = time.perf_counter() + cycles * PING_INTERVAL
+    while time.perf_counter() < end:
+        peak_threads = max(peak_threads, threading.active_count() - base_threads)
+        time.sleep(0.02)
+    rss = rss_mb()
+    stop.set()
+    responder.join()
+
+    timed_out = sum(s.closed for s in sockets)
+    print(f"{'legacy' if legacy else 'scheduler'} clients={clients}: peak threads +{peak_threads}, "
+          f"rss {rss:.0f} MB, pings answered {counts['pings']} "
+          f"(expected ~{clients * cycles}), closed by timeout {timed_out}")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--legacy", action="store_true", help="thread per ping, as engineio did before")
+    args = parser.parse_args()
+    for clients in args.clients:
+        # Separate processes so thread stacks and RSS don't carry over
+        pid = os.fork()
+        if pid == 0:
+            run(clients, args.cycles, args.legacy)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main()
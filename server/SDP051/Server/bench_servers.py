@@ -0,0 +1,124 @@
+"""
+Connection-count benchmark of the threaded (server.py) and asyncio
+(async_server.py) control servers.
+
+Each mode runs in its own process on 127.0.0.1. The benchmark opens
+`clients` websocket connections that each join the queue and then sit idle,
+then measures:
+
+  connect  time for all clients to connect and join the queue
+  rss      resident memory of the server process (from /proc)
+  threads  thread count of the server process (from /proc)
+  rtt      adminRequestStats round trips from an admin client while the
+           idle clients stay connected
+
+Needs python-socketio[asyncio_client] and uvicorn; Linux only for /proc.
+
+    python bench_servers.py [clients] [threaded|async ...]
+"""
+
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import socketio
+
+PORTS = {"threaded": 4200, "async": 4201}
+CONNECT_CONCURRENCY = 100  # Clients connecting at the same time
+ROUND_TRIPS = 200
+
+
+def serve(mode, port):
+    """Run one server mode in this process"""
+    if mode == "threaded":
+        import server
+        server.start_background_tasks()
+        server.socketio.run(server.app, host="127.0.0.1", port=port, allow_unsafe_werkzeug=True, log_output=False)
+    else:
+        import uvicorn
+        uvicorn.run("async_server:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def proc_status(pid):
+    """VmRSS in MiB and thread count of a process"""
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.split()
+    return int(status["VmRSS"][0]) / 1024, int(status["Threads"][0])
+
+
+def pct(samples, p):
+    return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000
+
+
+async def connect_clients(url, count):
+    clients = []
+    limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect():
+        async with limit:
+            client = socketio.AsyncClient(reconnection=False)
+            await client.connect(url, transports=["websocket"])
+            await client.emit("userRequestAdd", {})
+            clients.append(client)
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+    return clients
+
+
+async def round_trips(url, count):
+    admin = socketio.AsyncClient(reconnection=False)
+    answered = asyncio.Queue()
+    admin.on("adminResponseStats", answered.put_nowait)
+    await admin.connect(url, transports=["websocket"])
+
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await admin.emit("adminRequestStats", {})
+        await asyncio.wait_for(answered.get(), 5)
+        samples.append(time.perf_counter() - start)
+    await admin.disconnect()
+    return sorted(samples)
+
+
+async def bench(mode, clients):
+    port = PORTS[mode]
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", mode, str(port)],
+                               cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(2)
+        base_rss, base_threads = proc_status(process.pid)
+
+        start = time.perf_counter()
+        connected = await connect_clients(url, clients)
+        connect_time = time.perf_counter() - start
+        await asyncio.sleep(1)
+        rss, threads = proc_status(process.pid)
+
+        samples = await round_trips(url, ROUND_TRIPS)
+        print(f"{mode:>8}: clients={len(connected)} connect={connect_time:.2f}s "
+              f"rss={base_rss:.1f}->{rss:.1f}MiB threads={base_threads}->{threads} "
+              f"rtt mean={statistics.mean(samples) * 1000:.3f}ms p50={pct(samples, 50):.3f}ms "
+              f"p99={pct(samples, 99):.3f}ms")
+
+        await asyncio.gather(*(client.disconnect() for client in connected))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        serve(sys.argv[2], int(sys.argv[3]))
+    else:
+        clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+        for mode in sys.argv[2:] or ["threaded", "async"]:
+            asyncio.run(bench(mode, clients))
@@ -0,0 +1,143 @@
+"""
+WebSocket compression cost per connection, threaded server.
+
+Opens N in-memory WebSocket connections through wsproto, the client side
+offering permessage-deflate like a browser does, and plays the queue's
+traffic over them: a handover per round (controlOff to the old driver,
+timestart to the new one), the new driver's 9 byte control frames, and
+for the admin panels an adminQueuePatch per round with a full queue
+snapshot now and then. Idle visitors get nothing. Then the client ends
+are dropped and what the server ends still hold is measured. Reports
+the server's CPU time and zlib memory per connection for each policy:
+
+    on         permessage-deflate on every message (simple-websocket's old default)
+    threshold  ws_compression.py's default, 1024 byte threshold, no context takeover
+    off        no compression
+
+    python bench_ws_compression.py [--connections 1000] [--rounds 20]
+"""
+
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+
+from simple_websocket import Compression
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, BytesMessage, Message, Request, TextMessage
+from wsproto.extensions import PerMessageDeflate
+
+from ws_compression import DEFAULT_THRESHOLD
+
+TIMESTART = '42["timestart",90]'
+CONTROL_OFF = '42["controlOff","ack"]'
+PATCH = '42["adminQueuePatch",{"seq":%d,"ops":[{"op":"update","sid":"h3Kx9bQ2Aa0001","fields":{"timeRemaining":%d}}]}]'
+SNAPSHOT = '42["adminResponseQueue",{"seq":%d,"queue":[%s],"current_index":0}]'
+USER = '{"sid":"h3Kx9bQ2Aa%04d","timeAllowed":90,"timeRemaining":90}'
+# a controlFrame event is a placeholder packet, then the frame as its attachment
+CONTROL_EVENT = '451-["controlFrame",{"_placeholder":true,"num":0}]'
+CONTROL = bytes([0x11, 0, 0, 0x7F, 0, 0x40, 0, 0, 1])  # control_frame.py layout
+FRAMES_PER_ROUND = 50  # a second of driving at the server's CONTROL_RATE_HZ
+SNAPSHOT_EVERY = 10  # rounds between full queue snapshots to the admins
+
+
+def policy_extensions(name):
+    """Server extensions for a policy, and the Compression keeping stats if any"""
+    if name == "on":
+        return (lambda: [PerMessageDeflate()]), None
+    if name == "threshold":
+        compression = Compression(threshold=DEFAULT_THRESHOLD)
+        return (lambda: [compression.extension()]), compression
+    return (lambda: []), None
+
+
+def open_pair(extensions):
+    client = WSConnection(ConnectionType.CLIENT)
+    server = WSConnection(ConnectionType.SERVER)
+    server.receive_data(client.send(Request(host="sdp051", target="/socket.io/?EIO=4&transport=websocket",
+                                            extensions=[PerMessageDeflate()])))
+    for event in server.events():
+        if isinstance(event, Request):
+            client.receive_data(server.send(AcceptConnection(extensions=extensions())))
+    list(client.events())
+    return client, server
+
+
+def play(pairs, rounds, cpu):
+    """Queue traffic, only the server's side counts in cpu[0]"""
+    snapshot = SNAPSHOT % (0, ",".join(USER % i for i in range(20)))
+    for r in range(rounds):
+        driver = r % len(pairs)
+        for i, (client, server) in enumerate(pairs):
+            start = time.thread_time()
+            out = b""
+            if i % 50 == 0:  # the admin panels
+                out += server.send(Message(data=PATCH % (r, 90 - r)))
+                if r % SNAPSHOT_EVERY == 0:
+                    out += server.send(Message(data=snapshot))
+            if i == driver:
+                out += server.send(Message(data=TIMESTART))
+            elif i == (driver - 1) % len(pairs):
+                out += server.send(Message(data=CONTROL_OFF))
+            cpu[0] += time.thread_time() - start
+            if out:
+                client.receive_data(out)
+                list(client.events())
+            if i != driver:
+                continue
+            for _ in range(FRAMES_PER_ROUND):
+                data = client.send(Message(data=CONTROL_EVENT)) + client.send(Message(data=CONTROL))
+                start = time.thread_time()
+                server.receive_data(data)
+                for event in server.events():
+                    assert isinstance(event, (TextMessage, BytesMessage))
+                cpu[0] += time.thread_time() - start
+
+
+def run(name, connections, rounds, trace_memory):
+    extensions, compression = policy_extensions(name)
+    if trace_memory:
+        tracemalloc.start()
+    pairs = [open_pair(extensions) for _ in range(connections)]
+    cpu = [0.0]
+    play(pairs, rounds, cpu)
+    servers = [server for _, server in pairs]
+    del pairs
+    gc.collect()
+    if trace_memory:
+        before = tracemalloc.get_traced_memory()[0]
+        del servers
+        gc.collect()
+        held = before - tracemalloc.get_traced_memory()[0]
+        print(f"  {name:9s} server side held {held / 1024 / 1024:7.1f} MB, "
+              f"{held / connections / 1024:6.1f} KB per connection")
+        return
+    line = (f"  {name:9s} server cpu {cpu[0] * 1000:8.1f} ms, "
+            f"{cpu[0] / connections / rounds * 1e6:6.1f} us per connection per round")
+    if compression is not None:
+        stats = compression.stats()
+        line += (f" | policy stats: {stats['compressed']} compressed, {stats['skipped']} skipped, "
+                 f"{stats['decompressed']} decompressed, {stats['memory'] / 1024:.0f} KB zlib state")
+    print(line)
+    del servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    for trace_memory in (False, True):
+        print("memory (tracemalloc, after the traffic)" if trace_memory else "cpu")
+        for name in ("on", "threshold", "off"):
+            # Separate processes so memory from one policy doesn't carry over
+            pid = os.fork()
+            if pid == 0:
+                run(name, args.connections, args.rounds, trace_memory)
+                os._exit(0)
+            os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+WebSocket unmasking throughput, wsproto.
+
+Everything a browser sends is masked, so the server XORs every incoming
+payload with the frame's key before anything else looks at it. This times
+XorMaskerSimple (translate tables) against XorMaskerWide (one integer XOR
+for small payloads) over payloads from 8 B to 1 MB: the 9 byte control
+frames, Socket.IO events, and MJPEG frames as they would arrive when a
+camera pushes JPEGs over a WebSocket. Then it times the server's whole
+receive path, wsproto's WSConnection fed in simple-websocket's 4096 byte
+reads, with each masker selected.
+
+    python bench_ws_masking.py [--repeat 5]
+"""
+
+import argparse
+import os
+import time
+
+from wsproto import ConnectionType, WSConnection, frame_protocol
+from wsproto.events import AcceptConnection, BytesMessage, Message, Request
+
+RECEIVE_BYTES = 4096  # simple-websocket's default read size
+
+PAYLOADS = [
+    ("8 B", 8),
+    ("control frame", 9),
+    ("socket.io event", 60),
+    ("125 B", 125),
+    ("512 B", 512),
+    ("1 KB", 1024),
+    ("4 KB", 4096),
+    ("16 KB", 16384),
+    ("MJPEG 640x480", 45000),
+    ("MJPEG 1280x720", 120000),
+    ("1 MB", 1 << 20),
+]
+MASKERS = [("simple", frame_protocol.XorMaskerSimple), ("wide", frame_protocol.XorMaskerWide)]
+
+
+def jpeg_like(size):
+    """Random bytes between JPEG markers, masking cost doesn't depend on content"""
+    return b"\xff\xd8" + os.urandom(max(size - 4, 0)) + b"\xff\xd9"
+
+
+def compare(fns, count, repeat):
+    """Best of repeat runs of count calls of each fn, seconds per call.
+    The fns take turns within each repeat so drift hits them alike."""
+    best = [float("inf")] * len(fns)
+    for _ in range(repeat):
+        for i, fn in enumerate(fns):
+            start = time.perf_counter()
+            for _ in range(count):
+                fn()
+            best[i] = min(best[i], time.perf_counter() - start)
+    return [b / count for b in best]
+
+
+def calls_for(size):
+    return max(20, min(20000, (8 << 20) // size))
+
+
+def bench_maskers(repeat):
+    print("masker.process (MB/s)")
+    key = os.urandom(4)
+    for label, size in PAYLOADS:
+        data = jpeg_like(size) if label.startswith("MJPEG") else os.urandom(size)
+        per_call = compare([lambda masker=masker: masker(key).process(data) for _, masker in MASKERS],
+                           calls_for(size), repeat)
+        results = [size / t / 1e6 for t in per_call]
+        print(f"  {label:16s} {size:8d} B: " + "  ".join(
+            f"{name} {mbs:7.1f}" for (name, _), mbs in zip(MASKERS, results)) +
+            f"  x{results[1] / results[0]:.2f}")
+
+
+def connect():
+    client = WSConnection(ConnectionType.CLIENT)
+    server = WSConnection(ConnectionType.SERVER)
+    server.receive_data(client.send(Request(host="sdp051", target="/socket.io/?EIO=4&transport=websocket")))
+    for event in server.events():
+        if isinstance(event, Request):
+            client.receive_data(server.send(AcceptConnection()))
+    list(client.events())
+    return client, server
+
+
+def bench_receive(repeat):
+    print("server receive path, 4096 byte reads (us per message)")
+    for label, size in PAYLOADS:
+        client, server = connect()
+        data = jpeg_like(size) if label.startswith("MJPEG") else os.urandom(size)
+        wire = client.send(Message(data=data))  # masked as a browser would
+        reads = [wire[i:i + RECEIVE_BYTES] for i in range(0, len(wire), RECEIVE_BYTES)]
+
+        def receive(masker):
+            frame_protocol.XorMasker = masker
+            for chunk in reads:
+                server.receive_data(chunk)
+                for event in server.events():
+                    assert isinstance(event, BytesMessage)
+        per_call = compare([lambda masker=masker: receive(masker) for _, masker in MASKERS], calls_for(size), repeat)
+        results = [t * 1e6 for t in per_call]
+        frame_protocol.XorMasker = frame_protocol.XorMaskerWide
+        print(f"  {label:16s} {size:8d} B: " + "  ".join(
+            f"{name} {us:9.2f}" for (name, _), us in zip(MASKERS, results)) +
+            f"  x{results[0] / results[1]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    bench_maskers(args.repeat)
+    bench_receive(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+"""
+Queue, admin and Pi relay logic for the control server.
+
+Shared by the threaded server (server.py) and the asyncio server
+(async_server.py). ControlService never touches Socket.IO directly: it
+sends through the `send(event, data, to)` and `join(sid, room)` callables
+it is given, and each server wires those to its own transport. Event
+handlers are plain methods taking the sender's sid, see EVENTS.
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+
+# The control message layout is defined once, in car_control/control_frame.py.
+# Appended, so car_control's modules never shadow an installed package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "car_control"))
+
+from control_frame import CONTROL_HEADER, FRAME_SIZE, encode_stop
+from control_slot import ControlSlot
+from control_token import issue_token
+from link_monitor import LinkMonitor
+from logs import SampledLogger, get_logger
+from queue_state import make_queue_state
+
+queue_log = get_logger("queue")
+control_log = get_logger("control")
+control_debug = SampledLogger(control_log)
+admin_log = get_logger("admin")
+conn_log = get_logger("conn")
+
+ADMIN_ROOM = "admins"  # Socket.IO room all admin panels join
+ADMIN_USERNAME = "SDP051"
+ADMIN_PASSWORD = "SDP051051"
+
+# Users may only send CONTROL messages, STOP comes from the server
+STOP_FRAME = encode_stop()
+
+# Direct control: the active user drives over a WebRTC data channel straight
+# to the Pi (car_control/direct_control.py) and the server only hands out
+# tokens. Off unless the secret shared with the Pi and the Pi's signaling
+# URL (must be https when the page is) are both set.
+PI_CONTROL_SECRET = os.environ.get("SDP051_PI_SECRET")
+PI_CONTROL_URL = os.environ.get("SDP051_PI_CONTROL_URL")
+DIRECT_CONTROL = bool(PI_CONTROL_SECRET and PI_CONTROL_URL)
+
+# Engine.IO packet counters per packet type for the admin stats. Off unless
+# SDP051_PACKET_TRACE is on (1, true, on...), SDP051_PACKET_TRACE_SAMPLE=N
+# then also logs one packet in N.
+PACKET_TRACE = os.environ.get("SDP051_PACKET_TRACE", "").strip().lower() not in ("", "0", "false", "off", "no")
+PACKET_TRACE_SAMPLE = int(os.environ.get("SDP051_PACKET_TRACE_SAMPLE") or 0)
+if PACKET_TRACE and PACKET_TRACE_SAMPLE > 0:
+    PACKET_TRACE = PACKET_TRACE_SAMPLE
+
+# Control frames reach the Pi at most CONTROL_RATE_HZ times a second, newest
+# wins, and a frame that waited longer than CONTROL_MAX_AGE seconds is dropped
+CONTROL_RATE_HZ = 50
+CONTROL_MAX_AGE = 0.1
+
+# Session timer settings
+TIMER_TICK = 0.25  # Seconds between deadline checks
+ADMIN_TIME_PUSH_INTERVAL = 5  # Seconds between remaining-time updates to admins
+
+ADMIN_LOG_LINES = 50  # Log lines sent to admins when they ask without a valid limit
+
+# While a user holds control the Pi gets a heartbeat every HEARTBEAT_INTERVAL
+# seconds and echoes it, for the link's round trip times. It doesn't keep the
+# car going: the Pi's watchdog (car_control/watchdog.py) is only fed by the
+# driver's control frames.
+HEARTBEAT_INTERVAL = 0.1
+
+# Socket.IO event -> ControlService handler
+EVENTS = {
+    "connect": "on_connect",
+    "disconnect": "on_disconnect",
+    "userRequestAdd": "on_user_request_add",
+    "identify": "on_identify",
+    "adminRequestQueue": "on_admin_request_queue",
+    "adminUpdateUser": "on_admin_update_user",
+    "adminRemoveUser": "on_admin_remove_user",
+    "adminForceNext": "on_admin_force_next",
+    "adminEmergencyStop": "on_admin_emergency_stop",
+    "adminRequestStats": "on_admin_request_stats",
+    "adminRequestLogs": "on_admin_request_logs",
+    "adminSetDefaultTime": "on_admin_set_default_time",
+    "controlFrame": "on_control_frame",
+    "pi_heartbeat_ack": "on_pi_heartbeat_ack",
+}
+
+
+# Admins get the full queue once, then versioned patches. Each patch carries
+# the next "seq" and a list of ops:
+#   {"op": "insert", "user": {...}}          appended at the end of the queue
+#   {"op": "remove", "sid": sid}
+#   {"op": "update", "sid": sid, "fields": {...}}
+#   {"op": "current", "sid": sid or None}    the active marker moved
+# An admin that sees a gap in seq asks for the full queue again.
+def current_op(user):
+    """Patch op moving the active marker to a user"""
+    return {"op": "current", "sid": user.sid if user is not None else None}
+
+
+class ControlService:
+    def __init__(self, send, join, log_ring=None, state=None, packet_trace=None, compression=None):
+        self.send = send  # send(event, data, to)
+        self.join = join  # join(sid, room)
+        self.log_ring = log_ring  # Recent log lines, served to admins
+        self.packet_trace = packet_trace  # The Engine.IO server's packet counters, if enabled
+        self.compression = compression  # The WebSocket compression policy, if it keeps stats
+
+        # Queue, Pi sid and direct control token, possibly shared with other
+        # server processes (see queue_state.py)
+        self.state = state if state is not None else make_queue_state()
+        # Admin sockets connected to this process, all joined to ADMIN_ROOM
+        self.admin_sids = set()
+        # Frames on their way to the Pi. Per process: the active user's
+        # socket, and so its frames, live in one process.
+        self.control_slot = ControlSlot(CONTROL_RATE_HZ, CONTROL_MAX_AGE)
+        # The Pi's socket if it is connected to this process, heartbeats go
+        # from here and come back here
+        self.local_pi_sid = None
+        self.link = LinkMonitor()  # Heartbeat round trips
+        self.pi_watchdog_trips = 0  # As last reported by the Pi
+
+        # Serializes queue and session changes in this process: the timer
+        # thread ends sessions while request handlers add and remove users
+        self.session_lock = threading.RLock()
+
+        # session timer state
+        self.pushed_sid = None
+        self.next_push = 0
+
+    # ====================== QUEUE CONTROL ======================
+    def activate_current_user(self):
+        """Hand control to the current user: a new session on the Pi, and their countdown"""
+        self._start_countdown(new_session=True)
+
+    def restart_countdown(self):
+        """Restart the current user's countdown, same session, an emergency stop stays latched"""
+        self._start_countdown(new_session=False)
+
+    def _start_countdown(self, new_session):
+        # the server owns the deadline, the browser countdown is only for display
+        current_user = self.state.start_current(time.monotonic())
+        if current_user is None:
+            return
+
+        queue_log.info("%s user: %s, time allowed: %ss", "Activating" if new_session else "Restarting countdown of",
+                       current_user.sid, current_user.time_allowed)
+        # only the server starts a session on the Pi, and only on a handover:
+        # it resets the frame seq and releases an emergency stop
+        pi_sid = self.state.get_pi_sid()
+        if new_session and pi_sid:
+            self.send('pi_session_start', None, pi_sid)
+        self.send('timestart', current_user.time_allowed, current_user.sid)
+        self.grant_direct_control(current_user)
+
+    def grant_direct_control(self, user):
+        """Give the active user a token for a direct data channel to the Pi"""
+        if not DIRECT_CONTROL or not self.state.get_pi_sid():
+            self.revoke_direct_control()
+            return
+
+        # the token expires together with the user's control time
+        token_id, token = issue_token(PI_CONTROL_SECRET, user.deadline - time.monotonic())
+        self.send_revoke(self.state.swap_direct_token(token_id))
+        self.send('directControl', {"url": PI_CONTROL_URL, "token": token}, user.sid)
+
+    def revoke_direct_control(self):
+        """Make the Pi drop the direct channel of the previous active user"""
+        self.send_revoke(self.state.swap_direct_token(None))
+
+    def send_revoke(self, token_id):
+        """Tell the Pi a direct control token is no longer valid"""
+        if token_id is None:
+            return
+        pi_sid = self.state.get_pi_sid()
+        if pi_sid:
+            self.send('pi_revoke', token_id, pi_sid)
+
+    def add_user(self, session_id, time_allowed=None):
+        """Add a user to the queue"""
+        with self.session_lock:
+            return self._add_user(session_id, time_allowed)
+
+    def _add_user(self, session_id, time_allowed):
+        user, became_current = self.state.add(session_id, time_allowed)
+        if user is None:
+            return None  # already queued, a double click or a retry
+        ops = [{"op": "insert", "user": user.to_dict()}]
+
+        if became_current:
+            self.activate_current_user()
+            ops.append(current_op(user))
+
+        queue_log.info("New client added to queue: %s", session_id)
+        self.notify_admins_patch(*ops)
+        return user
+
+    def remove_user(self, session_id):
+        """Remove a user from the queue"""
+        with self.session_lock:
+            self._remove_user(session_id)
+
+    def _remove_user(self, session_id):
+        user, was_active = self.state.remove(session_id)
+        if user is None:
+            return
+        ops = [{"op": "remove", "sid": session_id}]
+
+        if was_active:
+            #deactivate current user
+            self.stop_car()
+            self.revoke_direct_control()
+            self.send('controlOff', 'ack', session_id)
+            # control already moved on to the next user in line
+            self.activate_current_user()
+            ops.append(current_op(self.state.current()))
+
+        queue_log.info("Client removed from queue: %s", session_id)
+        self.notify_admins_patch(*ops)
+
+    def end_current_user(self, session_id):
+        """Take control away from a user and hand it to the next one"""
+        with self.session_lock:
+            # Move to the next user in the queue. Does nothing if a disconnect,
+            # an admin or another server process got there first.
+            current_user = self.state.end_current(session_id)
+            if current_user is None:
+                return
+
+            self.stop_car()
+            self.revoke_direct_control()
+            self.send('controlOff', 'ack', session_id)
+
+            self.activate_current_user()
+            self.notify_admins_patch({"op": "update", "sid": session_id, "fields": {"timeRemaining": 0}},
+                                     current_op(current_user))
+
+    def stop_car(self):
+        """
+        Send STOP to the Pi, ahead of anything in the control slot. Called
+        whenever a session ends: the outgoing user's frames are no longer
+        relayed, so without it the car would keep their last throttle and
+        steering until the next user drives. Returns False without a Pi.
+        """
+        self.control_slot.clear()
+        pi_sid = self.state.get_pi_sid()
+        if not pi_sid:
+            return False
+        self.send('pi_frame', STOP_FRAME, pi_sid)
+        return True
+
+    # ====================== PERIODIC WORK ======================
+    def check_session(self, now):
+        """
+        Run every TIMER_TICK: ends the control session when its time is up
+        and pushes the remaining time to admins every ADMIN_TIME_PUSH_INTERVAL.
+        Only the current user has a running deadline, so this covers everyone.
+        With several server processes only the leader runs it, see queue_state.py.
+        """
+        if not self.state.is_leader():
+            return
+        with self.session_lock:
+            self._check_session(now)
+
+    def _check_session(self, now):
+        current_user = self.state.current()
+        if current_user is None or current_user.deadline is None:
+            return
+
+        remaining = current_user.deadline - now
+        if remaining <= 0:
+            queue_log.info("Time ended for user: %s", current_user.sid)
+            self.end_current_user(current_user.sid)
+        elif current_user.sid != self.pushed_sid or now >= self.next_push:
+            time_remaining = math.ceil(remaining)
+            self.state.set_time_remaining(current_user.sid, time_remaining)
+            self.notify_admins_patch({"op": "update", "sid": current_user.sid,
+                                      "fields": {"timeRemaining": time_remaining}})
+            self.pushed_sid = current_user.sid
+            self.next_push = now + ADMIN_TIME_PUSH_INTERVAL
+
+    def send_heartbeat(self, now):
+        """Run every HEARTBEAT_INTERVAL: time a round trip to the Pi while a user holds control"""
+        # only the process holding the Pi's socket sends, so one per Pi
+        if self.local_pi_sid is None:
+            return
+        current_user = self.state.current()
+        if current_user is None or current_user.deadline is None:
+            return
+        self.send('pi_heartbeat', self.link.send(now), self.local_pi_sid)
+
+    def flush_control(self, now):
+        """Run every control_slot.interval: send a frame held back by the rate limit"""
+        frame = self.control_slot.take(now)
+        if frame is None:
+            return
+        pi_sid = self.state.get_pi_sid()
+        if pi_sid:
+            self.send('pi_frame', frame, pi_sid)
+
+    # ====================== ADMIN NOTIFICATION FUNCTIONS ======================
+    def notify_admins_queue(self):
+        """Send the current queue to all admin clients"""
+        self.send("adminResponseQueue", self.state.snapshot(), ADMIN_ROOM)
+
+    def notify_admins_patch(self, *ops):
+        """Send queue changes to all admin clients"""
+        patch = {"seq": self.state.next_version(), "ops": ops}
+        self.send("adminQueuePatch", patch, ADMIN_ROOM)
+
+    def notify_admins(self, message):
+        """Send a notification message to all admin clients"""
+        self.send("adminNotification", {"message": message, "timestamp": time.time()}, ADMIN_ROOM)
+
+    def notify_pi_status(self):
+        """Send Raspberry Pi connection status to all admin clients"""
+        self.send("piStatus", {"connected": self.state.get_pi_sid() is not None}, ADMIN_ROOM)
+
+    # ====================== SOCKET.IO EVENTS ======================
+    def on_connect(self, sid, data=None):
+        """Handle new client connections"""
+        conn_log.debug("Client connected: %s", sid)
+
+    def on_user_request_add(self, sid, data=None):
+        """Handle request to add user to the control queue"""
+        self.add_user(sid)
+
+    def on_identify(self, sid, data=None):
+        """Identify special clients (Raspberry Pi)"""
+        if data.get("user_agent") == "Pi":
+            self.state.set_pi_sid(sid)
+            self.local_pi_sid = sid
+            conn_log.info("Pi connected: %s", sid)
+            self.notify_pi_status()
+            self.notify_admins("Raspberry Pi connected to server")
+
+            current_user = self.state.current()
+            if current_user is not None and current_user.deadline is not None:
+                self.grant_direct_control(current_user)
+
+    # ______________ ADMIN PANEL EVENTS ______________
+    def on_admin_request_queue(self, sid, data=None):
+        """Handle admin request for queue data"""
+        # a patch can't slip in between the snapshot and its seq, or go out
+        # before the admin is in the room
+        with self.session_lock:
+            if sid not in self.admin_sids:
+                self.admin_sids.add(sid)
+                self.join(sid, ADMIN_ROOM)
+
+            self.send("adminResponseQueue", self.state.snapshot(), sid)
+        self.notify_pi_status()
+
+    def on_admin_update_user(self, sid, data=None):
+        """Handle admin request to update a user's settings"""
+        if 'sid' in data and 'timeAllowed' in data:
+            user_sid = data['sid']
+            time_allowed = int(data['timeAllowed'])
+
+            with self.session_lock:
+                if not self.state.update(user_sid, time_allowed):
+                    return
+                self.notify_admins_patch({"op": "update", "sid": user_sid, "fields": {"timeAllowed": time_allowed}})
+            admin_log.info("Admin updated user %s: time allowed = %s", user_sid, time_allowed)
+            self.notify_admins(f"Updated time allowed for user {user_sid} to {time_allowed}s")
+
+    def on_admin_remove_user(self, sid, data=None):
+        """Handle admin request to remove a user from the queue"""
+        if 'sid' in data:
+            user_sid = data['sid']
+            self.remove_user(user_sid)
+            admin_log.info("Admin removed user %s from queue", user_sid)
+            self.notify_admins(f"Removed user {user_sid} from queue")
+
+    def on_admin_force_next(self, sid, data=None):
+        """Handle admin request to force next user"""
+        current_user = self.state.current()
+        if current_user is None:
+            return
+        self.end_current_user(current_user.sid)
+        admin_log.info("Admin forced next user")
+        self.notify_admins("Skipped to next user")
+
+    def on_admin_emergency_stop(self, sid, data=None):
+        """Handle admin emergency stop command"""
+        if self.stop_car():
+            admin_log.warning("EMERGENCY STOP triggered by admin")
+            self.notify_admins("EMERGENCY STOP command sent to Raspberry Pi")
+        else:
+            self.notify_admins("EMERGENCY STOP failed - No Raspberry Pi connected")
+
+    def on_admin_request_stats(self, sid, data=None):
+        """Handle admin request for control path counters, link latency, packet counts and compression cost"""
+        link = self.link.stats()
+        link["watchdog_trips"] = self.pi_watchdog_trips
+        stats = {"control": self.control_slot.stats(), "link": link}
+        if self.packet_trace is not None:
+            stats["packets"] = self.packet_trace.stats()
+        if self.compression is not None:
+            stats["compression"] = self.compression.stats()
+        self.send("adminResponseStats", stats, sid)
+
+    def on_admin_request_logs(self, sid, data=None):
+        """Handle admin request for recent server log lines"""
+        if self.log_ring is None:
+            self.send("adminResponseLogs", {"lines": []}, sid)
+            return
+        # the limit comes from the client: anything but a number gets the
+        # default, and numbers are kept within 1..ring size
+        try:
+            limit = int(data.get("limit", ADMIN_LOG_LINES))
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            limit = ADMIN_LOG_LINES
+        limit = max(1, min(limit, self.log_ring.capacity))
+        lines = self.log_ring.tail(limit)
+        self.send("adminResponseLogs", {"lines": lines}, sid)
+
+    def on_admin_set_default_time(self, sid, data=None):
+        """Handle admin request to set default time"""
+        time_seconds = int(data['time'])
+        with self.session_lock:
+            self._set_default_time(time_seconds)
+
+    def _set_default_time(self, time_seconds):
+        current_user = self.state.current()
+        cut_current = (current_user is not None and current_user.deadline is not None
+                       and current_user.deadline - time.monotonic() > time_seconds)
+        if self.state.set_default_time(time_seconds):
+            if cut_current:
+                # restart the active countdown with the shorter allowance
+                self.restart_countdown()
+            # every row changed, cheaper to resend the queue than patch it
+            self.state.next_version()
+            self.notify_admins_queue()
+            admin_log.info("Admin set default time to %ss", time_seconds)
+            self.notify_admins(f"Default time set to {time_seconds} seconds effect in server")
+    #___________________________________________________________________________
+
+    def on_disconnect(self, sid, data=None):
+        """Handle client disconnection"""
+        # Check if this is the Pi disconnecting
+        if sid == self.local_pi_sid:
+            self.local_pi_sid = None
+        if self.state.clear_pi_sid(sid):
+            conn_log.warning("Pi disconnected")
+            self.notify_pi_status()
+            self.notify_admins("Raspberry Pi disconnected from server")
+        else:
+            # Handle regular user disconnect
+            self.remove_user(sid)
+
+            # Also remove from admin list if applicable
+            # (Socket.IO drops the sid from ADMIN_ROOM by itself)
+            self.admin_sids.discard(sid)
+
+            conn_log.debug("Client disconnected: %s", sid)
+
+    def on_control_frame(self, sid, data=None):
+        """Forward a binary control frame from the active user to the Pi as-is"""
+        if not isinstance(data, bytes) or len(data) != FRAME_SIZE or data[0] != CONTROL_HEADER:
+            return
+        pi_sid = self.state.get_pi_sid()
+        if not pi_sid or not self.state.is_current(sid):
+            return
+
+        frame = self.control_slot.offer(data, time.monotonic())
+        if frame is not None:
+            self.send('pi_frame', frame, pi_sid)
+        control_debug.debug("Control frame from %s: %r", sid, data)
+
+    def on_pi_heartbeat_ack(self, sid, data=None):
+        """Handle the Pi echoing a heartbeat, with its watchdog trip count"""
+        if sid != self.local_pi_sid or not isinstance(data, dict):
+            return
+        self.link.ack(data.get("seq"), time.monotonic())
+        self.pi_watchdog_trips = data.get("trips", self.pi_watchdog_trips)
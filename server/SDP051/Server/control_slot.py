@@ -0,0 +1,72 @@
+"""
+Outbound control slot for the Pi.
+
+Only the newest control frame matters to the car, so instead of queueing
+every frame a user sends, the server keeps one slot per Pi. A frame goes
+out right away if the last one went out at least 1/rate_hz ago; otherwise
+it waits in the slot, where a newer frame replaces it, and a flusher sends
+it on the next tick. Frames that waited longer than max_age are dropped
+instead of being applied late.
+"""
+
+import threading
+
+
+class ControlSlot:
+    def __init__(self, rate_hz=50, max_age=0.1):
+        self.interval = 1.0 / rate_hz  # Minimum seconds between frames to the Pi
+        self.max_age = max_age  # Seconds a frame may wait before it is stale
+        self.lock = threading.Lock()
+        self.pending = None  # (frame, arrival time) waiting to be flushed
+        self.last_sent = 0.0
+
+        # Counters
+        self.received = 0
+        self.forwarded = 0
+        self.coalesced = 0  # Replaced by a newer frame before going out
+        self.dropped = 0  # Went stale in the slot
+
+    def offer(self, frame, now):
+        """Store a frame. Returns it if it should be sent right away, else None."""
+        with self.lock:
+            self.received += 1
+            if self.pending is None and now - self.last_sent >= self.interval:
+                self.last_sent = now
+                self.forwarded += 1
+                return frame
+
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (frame, now)
+            return None
+
+    def take(self, now):
+        """Pending frame that is due to be sent now, or None"""
+        with self.lock:
+            if self.pending is None or now - self.last_sent < self.interval:
+                return None
+
+            frame, arrived = self.pending
+            self.pending = None
+            if now - arrived > self.max_age:
+                self.dropped += 1
+                return None
+
+            self.last_sent = now
+            self.forwarded += 1
+            return frame
+
+    def clear(self):
+        """Forget the pending frame, e.g. when control changes hands"""
+        with self.lock:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = None
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "forwarded": self.forwarded,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,26 @@
+"""
+Tokens for the direct control path.
+
+The server hands the active user a token that the Pi checks before it
+accepts a WebRTC data channel from that browser (see
+car_control/direct_control.py). A token is "<id>.<expires>.<signature>",
+signed with a secret shared by the server and the Pi, and it is only good
+until the user's control time runs out.
+"""
+
+import hashlib
+import hmac
+import secrets
+import time
+
+
+def sign(secret, payload):
+    """HMAC-SHA256 of payload, hex encoded"""
+    return hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(secret, lifetime):
+    """Create a token valid for lifetime seconds. Returns (token_id, token)"""
+    token_id = secrets.token_urlsafe(9)
+    payload = f"{token_id}.{int(time.time() + lifetime)}"
+    return token_id, f"{payload}.{sign(secret, payload)}"
@@ -0,0 +1,75 @@
+"""
+MJPEG fan-out, one producer (the camera) to any number of viewers.
+
+publish() wraps each JPEG in its multipart headers once and stores the
+result with a generation number. Viewers wait for a generation newer than
+the one they sent last and always get the newest part, so a slow viewer
+skips frames instead of queueing them, and every viewer writes the same
+bytes object with no per-viewer copy or concatenation.
+"""
+
+import threading
+
+BOUNDARY = "frame"
+MIMETYPE = f"multipart/x-mixed-replace; boundary={BOUNDARY}"
+
+
+def frame_part(jpeg, boundary=BOUNDARY):
+    """A JPEG framed as one multipart part"""
+    header = (f"--{boundary}\r\nContent-Type: image/jpeg\r\n"
+              f"Content-Length: {len(jpeg)}\r\n\r\n").encode()
+    return b"".join((header, jpeg, b"\r\n"))
+
+
+class FrameBroadcaster:
+    def __init__(self, boundary=BOUNDARY):
+        self.boundary = boundary
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.part = None  # Newest framed part
+
+        # Counters
+        self.viewers = 0
+        self.published = 0
+        self.sent = 0
+        self.skipped = 0  # Frames viewers never got because a newer one replaced them
+
+    def publish(self, jpeg):
+        part = frame_part(jpeg, self.boundary)
+        with self.condition:
+            self.generation += 1
+            self.part = part
+            self.published += 1
+            self.condition.notify_all()
+
+    def wait(self, generation, timeout=None):
+        """
+        Newest (generation, part) after `generation`, or (generation, None)
+        if nothing new came within timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.generation != generation, timeout):
+                return generation, None
+            if generation:
+                self.skipped += self.generation - generation - 1
+            self.sent += 1
+            return self.generation, self.part
+
+    def stream(self, timeout=5.0):
+        """Generator of parts for one viewer, for a streaming response"""
+        with self.condition:
+            self.viewers += 1
+        try:
+            generation = 0
+            while True:
+                generation, part = self.wait(generation, timeout)
+                if part is not None:
+                    yield part
+        finally:
+            with self.condition:
+                self.viewers -= 1
+
+    def stats(self):
+        with self.condition:
+            return {"viewers": self.viewers, "published": self.published,
+                    "sent": self.sent, "skipped": self.skipped}
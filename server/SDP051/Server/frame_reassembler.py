@@ -0,0 +1,184 @@
+"""
+Reassembly of camera frames sent over UDP in fragments.
+
+Each datagram is an 8 byte header, network byte order:
+
+    uint32 frame id   counts up per frame, wraps
+    uint16 index      0 to count - 1
+    uint16 count      fragments in this frame
+
+then the payload. Every fragment but the last carries exactly
+FRAGMENT_SIZE bytes. The sender is camera/jpeg_fragments.py, keep the two
+in sync.
+
+Frames are assembled in a fixed pool of preallocated buffers, one per
+frame in flight, and handed out in frame id order: once a frame completes,
+older incomplete ones can never be shown and are dropped, and a frame
+that stays incomplete for `timeout` seconds is dropped too. Both count as
+lost.
+"""
+
+import socket
+import struct
+import time
+
+HEADER = struct.Struct("!IHH")
+FRAGMENT_SIZE = 1400
+MAX_DATAGRAM = HEADER.size + FRAGMENT_SIZE
+# A frame this far behind the last one handed out, or any older frame once
+# none has completed for `timeout`, means the sender restarted its count
+RESTART_GAP = 1000
+
+
+def id_newer(frame_id, last_id):
+    """Check if frame_id comes after last_id, allowing for wraparound"""
+    return 0 < ((frame_id - last_id) & 0xFFFFFFFF) < 0x80000000
+
+
+class PartialFrame:
+    def __init__(self, max_frame):
+        self.buffer = bytearray(max_frame)
+        self.view = memoryview(self.buffer)
+        self.frame_id = None  # None while the buffer is free
+        self.count = 0
+        self.received = bytearray()  # One flag per fragment
+        self.missing = 0
+        self.size = 0
+        self.started = 0.0
+
+    def reset(self, frame_id, count, now):
+        self.frame_id = frame_id
+        self.count = count
+        self.received = bytearray(count)
+        self.missing = count
+        self.size = (count - 1) * FRAGMENT_SIZE
+        self.started = now
+
+    def free(self):
+        self.frame_id = None
+
+
+class Reassembler:
+    def __init__(self, slots=4, max_frame=1 << 20, timeout=0.5, clock=time.monotonic):
+        self.max_fragments = max_frame // FRAGMENT_SIZE
+        self.pool = [PartialFrame(self.max_fragments * FRAGMENT_SIZE) for _ in range(slots)]
+        self.timeout = timeout
+        self.clock = clock
+        self.last_id = None  # Last frame handed out
+        self.last_time = 0.0
+
+        # Counters
+        self.frames = 0
+        self.lost = 0  # Frames dropped incomplete
+        self.late = 0  # Fragments of frames already handed out or dropped
+        self.duplicates = 0
+        self.malformed = 0
+
+    def feed(self, datagram):
+        """
+        Add one datagram. Returns the frame it completes as a memoryview,
+        valid until the next call, else None.
+        """
+        now = self.clock()
+        self.expire(now)
+
+        if len(datagram) < HEADER.size:
+            self.malformed += 1
+            return None
+        frame_id, index, count = HEADER.unpack_from(datagram)
+        payload = memoryview(datagram)[HEADER.size:]
+        last = index == count - 1
+        if (index >= count or count > self.max_fragments
+                or len(payload) > FRAGMENT_SIZE or (not last and len(payload) != FRAGMENT_SIZE)):
+            self.malformed += 1
+            return None
+        if self.last_id is not None and not id_newer(frame_id, self.last_id):
+            if ((self.last_id - frame_id) & 0xFFFFFFFF < RESTART_GAP
+                    and now - self.last_time < self.timeout):
+                self.late += 1
+                return None
+            self.restart()
+
+        partial = self.slot(frame_id, count, now)
+        if partial is None:
+            self.late += 1
+            return None
+        if partial.count != count:
+            self.malformed += 1
+            return None
+        if partial.received[index]:
+            self.duplicates += 1
+            return None
+
+        offset = index * FRAGMENT_SIZE
+        partial.view[offset:offset + len(payload)] = payload
+        partial.received[index] = 1
+        partial.missing -= 1
+        if last:
+            partial.size = offset + len(payload)
+        if partial.missing:
+            return None
+
+        # Complete: anything older is superseded
+        for other in self.pool:
+            if other.frame_id is not None and other is not partial and not id_newer(other.frame_id, frame_id):
+                other.free()
+                self.lost += 1
+        partial.free()
+        self.last_id = frame_id
+        self.last_time = now
+        self.frames += 1
+        return partial.view[:partial.size]
+
+    def slot(self, frame_id, count, now):
+        """The buffer for frame_id, taking a free one (or the oldest) if it is new"""
+        free = None
+        for partial in self.pool:
+            if partial.frame_id == frame_id:
+                return partial
+            if partial.frame_id is None and free is None:
+                free = partial
+        if free is None:
+            oldest = min(self.pool, key=lambda partial: partial.started)
+            if id_newer(oldest.frame_id, frame_id):
+                return None  # Older than everything in flight
+            oldest.free()
+            self.lost += 1
+            free = oldest
+        free.reset(frame_id, count, now)
+        return free
+
+    def restart(self):
+        for partial in self.pool:
+            partial.free()
+        self.last_id = None
+
+    def expire(self, now):
+        for partial in self.pool:
+            if partial.frame_id is not None and now - partial.started > self.timeout:
+                partial.free()
+                self.lost += 1
+
+    def stats(self):
+        return {"frames": self.frames, "lost": self.lost, "late": self.late,
+                "duplicates": self.duplicates, "malformed": self.malformed}
+
+
+def open_receiver(address, rcvbuf=4 << 20):
+    """UDP socket bound to address, with room for a few frames' bursts"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # A 720p frame arrives as a burst of ~100 datagrams
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind(address)
+    return sock
+
+
+def receive_frames(sock, reassembler, on_frame):
+    """Reassemble frames arriving on sock forever, calling on_frame with each"""
+    buffer = bytearray(MAX_DATAGRAM + 1)  # One extra byte to catch oversized datagrams
+    view = memoryview(buffer)
+    while True:
+        size = sock.recv_into(buffer)
+        frame = reassembler.feed(view[:size])
+        if frame is not None:
+            on_frame(frame)
@@ -0,0 +1,60 @@
+"""
+Round trip times of the server-Pi link.
+
+While a user holds control the server sends the Pi a numbered heartbeat
+every HEARTBEAT_INTERVAL and the Pi echoes the number back. LinkMonitor
+matches the echoes to the send times and keeps the last `window` round
+trips for percentiles. A heartbeat not echoed within `lost_after` seconds
+counts as lost.
+"""
+
+import collections
+import threading
+
+
+class LinkMonitor:
+    def __init__(self, window=500, lost_after=2.0):
+        self.lost_after = lost_after
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.pending = collections.OrderedDict()  # seq -> send time, oldest first
+        self.rtts = collections.deque(maxlen=window)
+
+        # Counters
+        self.sent = 0
+        self.acked = 0
+        self.lost = 0
+
+    def send(self, now):
+        """Number for the next heartbeat"""
+        with self.lock:
+            while self.pending:
+                seq, sent_at = next(iter(self.pending.items()))
+                if now - sent_at < self.lost_after:
+                    break
+                del self.pending[seq]
+                self.lost += 1
+
+            self.seq = (self.seq + 1) % 65536
+            self.pending[self.seq] = now
+            self.sent += 1
+            return self.seq
+
+    def ack(self, seq, now):
+        with self.lock:
+            sent_at = self.pending.pop(seq, None)
+            if sent_at is None:
+                return
+            self.acked += 1
+            self.rtts.append(now - sent_at)
+
+    def stats(self):
+        """Counters and round trip percentiles in milliseconds"""
+        with self.lock:
+            stats = {"sent": self.sent, "acked": self.acked, "lost": self.lost}
+            rtts = sorted(self.rtts)
+        if rtts:
+            for p in (50, 90, 99):
+                stats[f"rtt_p{p}"] = round(rtts[min(len(rtts) - 1, int(p / 100 * len(rtts)))] * 1000, 2)
+            stats["rtt_max"] = round(rtts[-1] * 1000, 2)
+        return stats
@@ -0,0 +1,110 @@
+"""
+Logging for the control server.
+
+Handlers never run on the thread that logs: records go onto a queue as
+they are and a QueueListener thread formats and writes them, so a
+Socket.IO handler does not wait on stdout. The listener also keeps the
+last lines in a ring buffer that admins can fetch.
+
+Every subsystem logs under "sdp051.<name>" and can get its own level with
+SDP051_LOG_LEVELS, e.g. "control=DEBUG,queue=WARNING" (default INFO).
+"""
+
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+
+ROOT_LOGGER = "sdp051"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` formatted records in memory"""
+
+    def __init__(self, capacity=500):
+        super().__init__()
+        self.capacity = capacity
+        self.lines = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+    def tail(self, limit=None):
+        """Most recent lines, oldest first"""
+        lines = list(self.lines)
+        return lines[-limit:] if limit else lines
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread too"""
+
+    def prepare(self, record):
+        return record
+
+
+class SampledLogger:
+    """
+    Debug logging for hot paths: only every `every`-th call is logged, and
+    nothing at all is formatted unless the logger is enabled for DEBUG.
+    """
+
+    def __init__(self, logger, every=50):
+        self.logger = logger
+        self.every = every
+        self.count = 0
+
+    def debug(self, msg, *args):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self.count += 1
+        if (self.count - 1) % self.every == 0:
+            self.logger.debug(msg + " (1 in %d)", *args, self.every)
+
+
+def get_logger(name):
+    """Logger for a server subsystem"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def parse_levels(spec):
+    """Parse "name=LEVEL,..." into a dict"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(levels=None, ring_size=500):
+    """
+    Route the "sdp051" loggers through a background listener.
+    Returns the ring buffer handler so recent lines can be served to admins.
+    """
+    if levels is None:
+        levels = parse_levels(os.environ.get("SDP051_LOG_LEVELS", ""))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    stream = logging.StreamHandler()
+    stream.setFormatter(formatter)
+    ring = RingBufferHandler(ring_size)
+    ring.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream, ring, respect_handler_level=True)
+    listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [DeferredQueueHandler(log_queue)]
+    root.setLevel("INFO")
+    root.propagate = False
+    for name, level in levels.items():
+        logger = root if name == "root" else get_logger(name)
+        try:
+            logger.setLevel(level)
+        except ValueError:
+            # a typo in the environment shouldn't keep the server from starting
+            root.warning("Ignoring unknown log level in SDP051_LOG_LEVELS: %s=%s", name, level)
+
+    return ring
@@ -0,0 +1,359 @@
+"""
+Queue state backends for ControlService.
+
+The service reads and changes the queue, the Pi's sid and the direct
+control token only through the methods below, each of which is atomic.
+Two backends implement them:
+
+  LocalQueueState   the UserQueue linked list behind a lock, for a single
+                    server process (the default)
+  SQLiteQueueState  a SQLite database shared by several server processes on
+                    one machine, e.g. workers behind a load balancer. Every
+                    change is one IMMEDIATE transaction, so when two workers
+                    race to end the same session or remove the same user,
+                    exactly one of them wins. Reads take no write lock.
+
+Users returned by a backend are read-only copies for the caller (for
+LocalQueueState they are the live nodes, do not change them directly).
+
+Deadlines are time.monotonic() values, which all processes on one machine
+share on Linux.
+
+Work that must happen once for all processes, like ending sessions on
+time, only runs where is_leader() is True.
+"""
+
+import contextlib
+import os
+import sqlite3
+import threading
+
+from user_queue import QueueUser, UserQueue
+
+
+class LocalQueueState:
+    def __init__(self, default_time=90):
+        self.lock = threading.RLock()
+        self.queue = UserQueue(default_time)
+        self.pi_sid = None
+        self.direct_token_id = None
+
+    def current(self):
+        """User holding control, or None"""
+        return self.queue.current
+
+    def is_current(self, session_id):
+        return self.queue.is_current(session_id)
+
+    def is_leader(self):
+        """A single process runs the session timer"""
+        return True
+
+    def add(self, session_id, time_allowed=None):
+        """Append a user. Returns (user, became_current), (None, False) if already queued."""
+        with self.lock:
+            if session_id in self.queue:
+                return None, False
+            user = self.queue.add(session_id, time_allowed)
+            return user, self.queue.current is user
+
+    def remove(self, session_id):
+        """Remove a user. Returns (user, was_active), (None, False) if not queued."""
+        with self.lock:
+            return self.queue.remove(session_id)
+
+    def start_current(self, now):
+        """Start the current user's countdown. Returns the user, or None."""
+        with self.lock:
+            user = self.queue.current
+            if user is not None:
+                user.deadline = now + user.time_allowed
+                user.time_remaining = user.time_allowed
+            return user
+
+    def end_current(self, session_id):
+        """
+        End the session of `session_id` and rotate to the next user.
+        Returns the new current user, or None if `session_id` was not current
+        (someone else already ended or removed it).
+        """
+        with self.lock:
+            user = self.queue.current
+            if user is None or user.sid != session_id:
+                return None
+            user.deadline = None
+            user.time_remaining = 0
+            return self.queue.rotate()
+
+    def set_time_remaining(self, session_id, seconds):
+        with self.lock:
+            user = self.queue.get(session_id)
+            if user is not None:
+                user.time_remaining = seconds
+
+    def update(self, session_id, time_allowed=None):
+        with self.lock:
+            return self.queue.update(session_id, time_allowed)
+
+    def set_default_time(self, time_seconds):
+        with self.lock:
+            return self.queue.set_default_time(time_seconds)
+
+    def next_version(self):
+        with self.lock:
+            return self.queue.next_version()
+
+    def snapshot(self):
+        with self.lock:
+            return self.queue.snapshot()
+
+    def get_pi_sid(self):
+        return self.pi_sid
+
+    def set_pi_sid(self, session_id):
+        self.pi_sid = session_id
+
+    def clear_pi_sid(self, session_id):
+        """Forget the Pi if it is `session_id`. Returns True if it was."""
+        with self.lock:
+            if self.pi_sid is None or self.pi_sid != session_id:
+                return False
+            self.pi_sid = None
+            return True
+
+    def swap_direct_token(self, token_id):
+        """Store the active direct control token. Returns the previous one."""
+        with self.lock:
+            previous, self.direct_token_id = self.direct_token_id, token_id
+            return previous
+
+
+class SQLiteQueueState:
+    """
+    Tables:
+      users  (seq, sid, time_allowed, time_remaining, deadline), seq is the
+             join order
+      state  key/value: current, version, default_time, pi_sid, direct_token_id
+
+    Every process holds a shared flock on <path>.lock while it runs. The
+    first process to start finds no other holder and clears the users and
+    the Pi left over from the last run, their sockets are gone. The session
+    timer's leader holds an exclusive flock on <path>.leader, when it exits
+    the next process to try takes over.
+    """
+
+    def __init__(self, path, default_time=90):
+        import fcntl  # POSIX only, LocalQueueState works without it
+        self.fcntl = fcntl
+        self.lock = threading.Lock()  # One transaction at a time per process
+        self.db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.leader_file = open(path + ".leader", "a")
+        self.leader = False
+        self.alive_file = open(path + ".lock", "a")
+        try:
+            self.fcntl.flock(self.alive_file, self.fcntl.LOCK_EX | self.fcntl.LOCK_NB)
+            first = True
+        except BlockingIOError:
+            first = False
+        with self.transaction() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS users (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                sid TEXT UNIQUE NOT NULL,
+                time_allowed INTEGER NOT NULL,
+                time_remaining INTEGER NOT NULL,
+                deadline REAL)""")
+            db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value)")
+            db.execute("INSERT OR IGNORE INTO state VALUES ('version', 0), ('default_time', ?)", (default_time,))
+            if first:
+                db.execute("DELETE FROM users")
+                db.execute("DELETE FROM state WHERE key IN ('current', 'pi_sid', 'direct_token_id')")
+        # blocks while a first process is still clearing
+        self.fcntl.flock(self.alive_file, self.fcntl.LOCK_SH)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Write-locked transaction, serialized across processes"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def read(self):
+        """Read transaction: a consistent snapshot that doesn't block other processes (WAL)"""
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                yield self.db
+            finally:
+                self.db.execute("COMMIT")
+
+    def _read_value(self, key):
+        """One state value, in autocommit mode"""
+        with self.lock:
+            return self._get(self.db, key)
+
+    def is_leader(self):
+        if not self.leader:
+            try:
+                self.fcntl.flock(self.leader_file, self.fcntl.LOCK_EX | self.fcntl.LOCK_NB)
+                self.leader = True
+            except BlockingIOError:
+                pass
+        return self.leader
+
+    # ______________ helpers, called inside a transaction ______________
+    @staticmethod
+    def _get(db, key):
+        row = db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set(db, key, value):
+        db.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _user(db, session_id):
+        if session_id is None:
+            return None
+        row = db.execute("SELECT sid, time_allowed, time_remaining, deadline FROM users WHERE sid = ?",
+                         (session_id,)).fetchone()
+        if row is None:
+            return None
+        user = QueueUser(row[0], row[1])
+        user.time_remaining = row[2]
+        user.deadline = row[3]
+        return user
+
+    @staticmethod
+    def _after(db, session_id):
+        """Sid of the user after `session_id` in join order, wrapping around"""
+        row = db.execute("SELECT sid FROM users WHERE seq > (SELECT seq FROM users WHERE sid = ?) "
+                         "ORDER BY seq LIMIT 1", (session_id,)).fetchone()
+        if row is None:
+            row = db.execute("SELECT sid FROM users ORDER BY seq LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    # ______________ queue ______________
+    def current(self):
+        with self.read() as db:
+            return self._user(db, self._get(db, "current"))
+
+    def is_current(self, session_id):
+        return session_id is not None and self._read_value("current") == session_id
+
+    def add(self, session_id, time_allowed=None):
+        with self.transaction() as db:
+            if self._user(db, session_id) is not None:
+                return None, False
+            if time_allowed is None:
+                time_allowed = self._get(db, "default_time")
+            db.execute("INSERT INTO users (sid, time_allowed, time_remaining) VALUES (?, ?, ?)",
+                       (session_id, time_allowed, time_allowed))
+            became_current = self._get(db, "current") is None
+            if became_current:
+                self._set(db, "current", session_id)
+            return self._user(db, session_id), became_current
+
+    def remove(self, session_id):
+        with self.transaction() as db:
+            user = self._user(db, session_id)
+            if user is None:
+                return None, False
+
+            was_active = self._get(db, "current") == session_id
+            if was_active:
+                following = self._after(db, session_id)
+                self._set(db, "current", following if following != session_id else None)
+            db.execute("DELETE FROM users WHERE sid = ?", (session_id,))
+            return user, was_active
+
+    def start_current(self, now):
+        with self.transaction() as db:
+            session_id = self._get(db, "current")
+            db.execute("UPDATE users SET deadline = ? + time_allowed, time_remaining = time_allowed WHERE sid = ?",
+                       (now, session_id))
+            return self._user(db, session_id)
+
+    def end_current(self, session_id):
+        with self.transaction() as db:
+            if self._get(db, "current") != session_id:
+                return None
+            db.execute("UPDATE users SET deadline = NULL, time_remaining = 0 WHERE sid = ?", (session_id,))
+            following = self._after(db, session_id)
+            self._set(db, "current", following)
+            return self._user(db, following)
+
+    def set_time_remaining(self, session_id, seconds):
+        with self.transaction() as db:
+            db.execute("UPDATE users SET time_remaining = ? WHERE sid = ?", (seconds, session_id))
+
+    def update(self, session_id, time_allowed=None):
+        with self.transaction() as db:
+            if time_allowed is None:
+                return self._user(db, session_id) is not None
+            return db.execute("UPDATE users SET time_allowed = ? WHERE sid = ?",
+                              (time_allowed, session_id)).rowcount > 0
+
+    def set_default_time(self, time_seconds):
+        if time_seconds < 10 or time_seconds > 300:
+            return False
+        with self.transaction() as db:
+            self._set(db, "default_time", time_seconds)
+            db.execute("UPDATE users SET time_allowed = ?1, time_remaining = MIN(time_remaining, ?1)",
+                       (time_seconds,))
+            return True
+
+    def next_version(self):
+        with self.transaction() as db:
+            version = self._get(db, "version") + 1
+            self._set(db, "version", version)
+            return version
+
+    def snapshot(self):
+        with self.read() as db:
+            current = self._get(db, "current")
+            rows = db.execute("SELECT sid, time_allowed, time_remaining FROM users ORDER BY seq").fetchall()
+            return {
+                "seq": self._get(db, "version"),
+                "queue": [{"sid": sid, "timeAllowed": allowed, "timeRemaining": remaining}
+                          for sid, allowed, remaining in rows],
+                "current_index": next((i for i, row in enumerate(rows) if row[0] == current), None)
+            }
+
+    # ______________ Pi ______________
+    def get_pi_sid(self):
+        return self._read_value("pi_sid")
+
+    def set_pi_sid(self, session_id):
+        with self.transaction() as db:
+            self._set(db, "pi_sid", session_id)
+
+    def clear_pi_sid(self, session_id):
+        with self.transaction() as db:
+            if session_id is None or self._get(db, "pi_sid") != session_id:
+                return False
+            self._set(db, "pi_sid", None)
+            return True
+
+    def swap_direct_token(self, token_id):
+        with self.transaction() as db:
+            previous = self._get(db, "direct_token_id")
+            self._set(db, "direct_token_id", token_id)
+            return previous
+
+
+def make_queue_state():
+    """
+    Backend picked by SDP051_QUEUE_DB: unset keeps the queue in this process,
+    a file path shares it through SQLite with every server using that path.
+    """
+    path = os.environ.get("SDP051_QUEUE_DB")
+    if path:
+        return SQLiteQueueState(path)
+    return LocalQueueState()
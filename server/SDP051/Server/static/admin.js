@@ -13,6 +13,7 @@ const nextUserBtn = document.getElementById('nextUserBtn');
 const emergencyStopBtn = document.getElementById('emergencyStopBtn');
 const defaultTimeInput = document.getElementById('defaultTimeInput');
 const setDefaultTimeBtn = document.getElementById('setDefaultTimeBtn');
+const serverLogsBtn = document.getElementById('serverLogsBtn');
 
 // Initialize Tabulator table
 const table = new Tabulator("#user-queue-table", {
@@ -75,6 +76,8 @@ const table = new Tabulator("#user-queue-table", {
         
         if (queueData.current_index !== undefined && rowIndex === queueData.current_index) {
             row.getElement().style.backgroundColor = "#d4edda";
+        } else {
+            row.getElement().style.backgroundColor = "";
         }
     },
     cellEdited: function(cell) {
@@ -125,10 +128,18 @@ socket.on('piStatus', (data) => {
 });
 
 // Queue updates
+// The server sends the full queue once (and on resync), then versioned
+// patches. A patch that skips a seq means we missed one, so ask again.
+let queueSeq = null;
+let currentSid = null;
+
 socket.on('adminResponseQueue', (data) => {
-    // Update queue data
-    queueData = data;
-    console.log(data);
+    queueSeq = data.seq;
+    currentSid = data.current_index !== null && data.current_index !== undefined && data.queue.length > 0
+        ? data.queue[data.current_index].sid
+        : null;
+    queueData = {current_index: data.current_index};
+
     // Convert the data for Tabulator
     const tableData = data.queue.map((user, index) => {
         return {
@@ -136,37 +147,88 @@ socket.on('adminResponseQueue', (data) => {
             position: index
         };
     });
-    
+
     // Update table
     table.replaceData(tableData);
-    
-    // Update status info
-    activeUsersEl.textContent = data.queue.length;
-    
-    const currentUserIndex = data.current_index;
-    if (currentUserIndex !== undefined && currentUserIndex !== null && data.queue.length > 0) {
-        const shortened = data.queue[currentUserIndex].sid.substring(0, 8) + '...';
-        currentUserEl.textContent = shortened;
-    } else {
-        currentUserEl.textContent = 'None';
-    }
-    
+    updateQueueStatus();
+
     addLogEntry(`Queue updated: ${data.queue.length} users`);
 });
 
-// Row updates
-socket.on('adminResponseRow', (row) => {
-    // Find the user in the local data
-    const userIndex = queueData.queue.findIndex(user => user.sid === row.sid);
-    console.log(userIndex);
-    if (userIndex !== -1) {
-        // Update the user data
-        //queueData.queue[userIndex] = {...queueData.queue[userIndex], ...row};
-        
-        // Update the table
-        //console.log(row);
-        table.updateData([{sid: row.sid, timeRemaining: row.timeRemaining}]);
+socket.on('adminQueuePatch', (patch) => {
+    if (queueSeq === null || patch.seq <= queueSeq) {
+        // waiting for a resync, or an old patch the snapshot already covers
+        return;
+    }
+    if (patch.seq !== queueSeq + 1) {
+        addLogEntry(`Missed queue update (${queueSeq} -> ${patch.seq}), resyncing`);
+        queueSeq = null;
+        socket.emit('adminRequestQueue', { message: 'resync' });
+        return;
     }
+    queueSeq = patch.seq;
+
+    // Only rows whose Index or Status changes are redrawn: the rows after a
+    // removed one move up, and the rows between the old and the new active
+    // user change status. An insert lands at the end and is drawn by addData.
+    const previousIndex = queueData.current_index;
+    let from = null;
+    let to = null;
+    const touch = (start, end) => {
+        from = from === null ? start : Math.min(from, start);
+        to = to === null ? end : Math.max(to, end);
+    };
+    patch.ops.forEach((op) => {
+        switch (op.op) {
+            case 'insert':
+                table.addData([op.user], false);
+                break;
+            case 'remove': {
+                const row = table.getRow(op.sid);
+                if (row) {
+                    const index = row.getPosition() - 1;
+                    table.deleteRow(op.sid);
+                    touch(index, table.getDataCount() - 1);
+                }
+                break;
+            }
+            case 'update':
+                table.updateData([{sid: op.sid, ...op.fields}]);
+                break;
+            case 'current':
+                currentSid = op.sid;
+                break;
+        }
+    });
+
+    const currentRow = currentSid ? table.getRow(currentSid) : false;
+    queueData.current_index = currentRow ? currentRow.getPosition() - 1 : null;
+    if (queueData.current_index !== previousIndex) {
+        const indexes = [previousIndex, queueData.current_index].filter(i => i !== null && i !== undefined);
+        if (indexes.length) {
+            touch(Math.min(...indexes), Math.max(...indexes));
+        }
+    }
+    if (from !== null) {
+        const last = Math.min(to, table.getDataCount() - 1);
+        for (let index = from; index <= last; index++) {
+            const row = table.getRowFromPosition(index + 1);
+            if (row) {
+                row.reformat();
+            }
+        }
+    }
+    updateQueueStatus();
+});
+
+function updateQueueStatus() {
+    activeUsersEl.textContent = table.getDataCount();
+    currentUserEl.textContent = currentSid ? currentSid.substring(0, 8) + '...' : 'None';
+}
+
+// Recent server log lines, on request
+socket.on('adminResponseLogs', (data) => {
+    data.lines.forEach(line => addLogEntry(`[server] ${line}`));
 });
 
 // Admin notifications from server
@@ -195,6 +257,11 @@ emergencyStopBtn.addEventListener('click', () => {
     }
 });
 
+// SERVER LOGS BUTTON
+serverLogsBtn.addEventListener('click', () => {
+    socket.emit('adminRequestLogs', { limit: 50 });
+});
+
 // DEFAULT TIME BUTTON
 setDefaultTimeBtn.addEventListener('click', () => {
     const defaultTime = parseInt(defaultTimeInput.value);
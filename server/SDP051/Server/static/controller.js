@@ -27,6 +27,26 @@ let activeMethod = 'bars';
 let prevT = 0;
 let prevS = 0;
 
+// Binary control message: uint8 header (version << 4 | type), int8 throttle,
+// int8 steer, uint16 seq, uint32 ms timestamp
+// (little endian, see car_control/control_frame.py)
+const CONTROL_FRAME_SIZE = 9;
+const CONTROL_HEADER = 1 << 4 | 1;  // version 1, CONTROL
+let controlSeq = 0;
+
+// The Pi's watchdog stops the car when no control frame arrives for 0.3s,
+// so while we have control the current command is resent every
+// KEEPALIVE_INTERVAL ms even when it doesn't change. A frozen page stops
+// sending and the car stops with it.
+const KEEPALIVE_INTERVAL = 100;
+let keepaliveInterval = null;
+
+// Direct control: when the server hands us a token, frames go straight to
+// the Pi over an unordered, no-retransmit WebRTC data channel instead of
+// through the server. Until it opens (or if it fails) we use the socket.
+let directPc = null;
+let directChannel = null;
+
 // Touch tracking for the bars method
 // Store touch data with identifier, element and position
 let activeTouches = [];
@@ -72,6 +92,50 @@ socket.on('controlOff', () => {
     endControl();
 });
 
+socket.on('directControl', (data) => {
+    openDirectControl(data.url, data.token).catch((error) => {
+        log(`Direct control unavailable: ${error.message}`);
+        closeDirectControl();
+    });
+});
+
+async function openDirectControl(url, token) {
+    closeDirectControl();
+
+    const pc = new RTCPeerConnection();
+    const channel = pc.createDataChannel('control', { ordered: false, maxRetransmits: 0 });
+    channel.binaryType = 'arraybuffer';
+    channel.onopen = () => log('Direct control channel open');
+    directPc = pc;
+    directChannel = channel;
+
+    await pc.setLocalDescription(await pc.createOffer());
+    // send the offer with all ICE candidates, the Pi does not trickle
+    await new Promise((resolve) => {
+        if (pc.iceGatheringState === 'complete') return resolve();
+        pc.addEventListener('icegatheringstatechange', () => {
+            if (pc.iceGatheringState === 'complete') resolve();
+        });
+    });
+
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ sdp: pc.localDescription.sdp, type: pc.localDescription.type, token: token })
+    });
+    if (!response.ok) throw new Error(`Pi refused the offer (${response.status})`);
+    if (directPc !== pc) return;  // closed while we were waiting
+    await pc.setRemoteDescription(await response.json());
+}
+
+function closeDirectControl() {
+    if (directPc) {
+        directPc.close();
+    }
+    directPc = null;
+    directChannel = null;
+}
+
 
 socket.on('connect_error', (error) => {
     log(`Connection error: ${error.message}`);
@@ -97,10 +161,16 @@ socket.on('disconnect', (reason) => {
 socket.on('timestart', (timeAllowed) => {
     log(`Control granted! Time: ${timeAllowed}s`);
     hasControl = true;
+    // seq starts over every session, the server tells the Pi (pi_session_start)
+    controlSeq = 0;
+    if (keepaliveInterval) {
+        clearInterval(keepaliveInterval);
+    }
+    keepaliveInterval = setInterval(() => sendFrame(prevT, prevS), KEEPALIVE_INTERVAL);
     statusDisplay.textContent = 'You have control!';
     statusDisplay.style.backgroundColor = '#d0ffd0';
     
-    // Start timer
+    // Start timer (display only, the server ends the session with controlOff)
     let timeLeft = timeAllowed;
     countdown.textContent = timeLeft;
     
@@ -110,11 +180,11 @@ socket.on('timestart', (timeAllowed) => {
     
     countdownInterval = setInterval(() => {
         timeLeft--;
-        countdown.textContent = timeLeft;
-        socket.emit('timeleft', { message: timeLeft });
+        countdown.textContent = Math.max(timeLeft, 0);
         
         if (timeLeft <= 0) {
-            endControl();
+            clearInterval(countdownInterval);
+            countdownInterval = null;
         }
     }, 1000);
 });
@@ -148,20 +218,20 @@ function endControl() {
         clearInterval(countdownInterval);
         countdownInterval = null;
     }
+    if (keepaliveInterval) {
+        clearInterval(keepaliveInterval);
+        keepaliveInterval = null;
+    }
     
     // Reset controls
     resetControls();
     hasControl = false;
+    closeDirectControl();
     
     // Update UI
     statusDisplay.textContent = 'Your turn ended. Waiting...';
     statusDisplay.style.backgroundColor = '#e0e0e0';
     countdown.textContent = 'wait';
-    
-    // Notify server
-
-    socket.emit('timeover', { message: 'control ended' });
-    
 }
 
 function resetControls() {
@@ -195,9 +265,26 @@ function sendControlCommand(throttleVal, steeringVal) {
 
     prevT = roundedT;
     prevS = roundedS;
-   
-    // Send command to server with percentage values
-    socket.emit('controlData', {t: roundedT, s: roundedS});
+    sendFrame(roundedT, roundedS);
+}
+
+// Send one control frame with percentage values, a new seq every time
+function sendFrame(roundedT, roundedS) {
+    if (!hasControl) return;
+
+    const frame = new DataView(new ArrayBuffer(CONTROL_FRAME_SIZE));
+    frame.setUint8(0, CONTROL_HEADER);
+    frame.setInt8(1, roundedT);
+    frame.setInt8(2, roundedS);
+    frame.setUint16(3, controlSeq, true);
+    frame.setUint32(5, Date.now() % 4294967296, true);
+    controlSeq = (controlSeq + 1) & 0xFFFF;
+
+    if (directChannel && directChannel.readyState === 'open') {
+        directChannel.send(frame.buffer);
+    } else {
+        socket.emit('controlFrame', frame.buffer);
+    }
 }
 
 // Find touch in active touches array
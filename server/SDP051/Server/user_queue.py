@@ -0,0 +1,159 @@
+"""
+Control queue for the car.
+
+Users are kept in a circular doubly linked list in the order they joined,
+with a dict from session id to node so lookups, removals and rotation are
+all O(1). `head` is the first user in admin order and `current` is the
+user holding the car.
+"""
+
+
+class QueueUser:
+    """A single queued user"""
+    __slots__ = ("sid", "time_allowed", "time_remaining", "deadline", "prev", "next")
+
+    def __init__(self, sid, time_allowed):
+        self.sid = sid
+        self.time_allowed = time_allowed
+        self.time_remaining = time_allowed
+        self.deadline = None  # time.monotonic() when control ends, while active
+        self.prev = self
+        self.next = self
+
+    def to_dict(self):
+        """Serialize the user the way the admin panel expects it"""
+        return {
+            "sid": self.sid,
+            "timeAllowed": self.time_allowed,
+            "timeRemaining": self.time_remaining
+        }
+
+
+class UserQueue:
+    def __init__(self, default_time=90):
+        self.users = {}  # sid -> QueueUser
+        self.head = None  # First user in admin order
+        self.current = None  # User with control
+        self.default_time = default_time  # Default time allowance in seconds
+        self.version = 0  # Bumped for every change the admin panel is told about
+
+    def __len__(self):
+        return len(self.users)
+
+    def __contains__(self, session_id):
+        return session_id in self.users
+
+    def __iter__(self):
+        """Iterate users in the order they joined the queue"""
+        user = self.head
+        for _ in range(len(self.users)):
+            yield user
+            user = user.next
+
+    def get(self, session_id):
+        """Get a user by session id, or None"""
+        return self.users.get(session_id)
+
+    def is_current(self, session_id):
+        """Check if a session holds control"""
+        return self.current is not None and self.current.sid == session_id
+
+    def add(self, session_id, time_allowed=None):
+        """
+        Append a user to the end of the queue. Returns the new user, or the
+        queued one if the sid is already in the queue.
+        """
+        user = self.users.get(session_id)
+        if user is not None:
+            return user
+        if time_allowed is None:
+            time_allowed = self.default_time
+
+        user = QueueUser(session_id, time_allowed)
+        self.users[session_id] = user
+
+        if self.head is None:
+            self.head = user
+            self.current = user
+        else:
+            # the tail sits right before head in the ring
+            tail = self.head.prev
+            user.prev = tail
+            user.next = self.head
+            tail.next = user
+            self.head.prev = user
+        return user
+
+    def remove(self, session_id):
+        """
+        Remove a user from the queue.
+        Returns (user, was_active), or (None, False) if the sid is not queued.
+        If the active user is removed, control passes to the user after it.
+        """
+        user = self.users.pop(session_id, None)
+        if user is None:
+            return None, False
+
+        was_active = user is self.current
+
+        if not self.users:
+            self.head = None
+            self.current = None
+        else:
+            user.prev.next = user.next
+            user.next.prev = user.prev
+            if user is self.head:
+                self.head = user.next
+            if was_active:
+                # wraps to the first user when the last one in line is removed
+                self.current = user.next
+
+        user.prev = user.next = user
+        return user, was_active
+
+    def rotate(self):
+        """Give control to the next user in line. Returns the new current user."""
+        if self.current is not None:
+            self.current = self.current.next
+        return self.current
+
+    def update(self, session_id, time_allowed=None):
+        """Update a user's properties"""
+        user = self.users.get(session_id)
+        if user is None:
+            return False
+        if time_allowed is not None:
+            user.time_allowed = time_allowed
+        return True
+
+    def set_default_time(self, time_seconds):
+        """Set the default time allowance, applied to everyone in the queue"""
+        if time_seconds < 10 or time_seconds > 300:
+            return False
+
+        self.default_time = time_seconds
+        for user in self.users.values():
+            user.time_allowed = time_seconds
+            if user.time_remaining > time_seconds:
+                user.time_remaining = time_seconds
+        return True
+
+    def next_version(self):
+        """Bump and return the version of the queue"""
+        self.version += 1
+        return self.version
+
+    def snapshot(self):
+        """Full queue state as sent to the admin panel"""
+        queue = []
+        current_index = None
+        for user in self:
+            # the current user's position is found on the same pass
+            if user is self.current:
+                current_index = len(queue)
+            queue.append(user.to_dict())
+        return {
+            "seq": self.version,
+            "queue": queue,
+            "current_index": current_index
+        }
@@ -1,8 +1,10 @@
 
 from flask import Flask, Response
-import socket
 import threading
 
+from frame_broadcaster import MIMETYPE, FrameBroadcaster
+from frame_reassembler import Reassembler, open_receiver, receive_frames
+
 # =^._.^= UDP + Flask MJPEG Server nya~!
 app = Flask(__name__)
 
@@ -10,31 +12,25 @@ app = Flask(__name__)
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5000
 HTTP_PORT = 3000
-latest_frame = b""  # Holds the latest JPEG frame nya~
+broadcaster = FrameBroadcaster()  # Holds the latest JPEG frame nya~
+reassembler = Reassembler()
 
 
 def udp_receiver():
-    global latest_frame
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((UDP_IP, UDP_PORT))
+    sock = open_receiver((UDP_IP, UDP_PORT))
     print(f"🐾 Listening for MJPEG on UDP {UDP_IP}:{UDP_PORT} nya~!")
-
-    while True:
-        data, _ = sock.recvfrom(65536)
-        # Only accept full JPEG frames nya~! (^･ω･^=)
-        if data.startswith(b'\xff\xd8') and data.endswith(b'\xff\xd9'):
-            latest_frame = data
+    # Frames come in fragments, see frame_reassembler.py nya~! (^･ω･^=)
+    receive_frames(sock, reassembler, broadcaster.publish)
 
 # 🍙 MJPEG streaming route!
-@app.route("/")
+@app.route("/video")
 def video_feed():
-    def generate():
-        while True:
-            if latest_frame:
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/jpeg\r\n\r\n" +
-                       latest_frame + b"\r\n")
-    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(broadcaster.stream(), mimetype=MIMETYPE)
+
+
+@app.route("/stats")
+def stats():
+    return {"udp": reassembler.stats(), "viewers": broadcaster.stats()}
 
 
 @app.route("/")
@@ -52,6 +48,7 @@ def index():
     """
 
 if __name__ == "__main__":
-    #threading.Thread(target=udp_receiver, daemon=True).start()
+    threading.Thread(target=udp_receiver, daemon=True).start()
     print(f"server ready at http://localhost:{HTTP_PORT}")
-    app.run(host="0.0.0.0", port=HTTP_PORT, debug=True)
+    # No reloader, its second process could not bind the UDP port
+    app.run(host="0.0.0.0", port=HTTP_PORT, debug=True, use_reloader=False)
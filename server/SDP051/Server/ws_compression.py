@@ -0,0 +1,63 @@
+"""
+permessage-deflate policy for the threaded server's WebSockets.
+
+Most of what goes over a client's socket is tiny: 9 byte control frames,
+timestart and controlOff, admin queue patches. Deflating those costs more
+CPU than it saves bytes, and with context takeover each connection keeps a
+compressor and a decompressor (about 300 KB of zlib state) for as long as
+it is open, idle or not. The policy here only compresses what is worth
+it, and without context takeover so idle connections hold no zlib state.
+
+SDP051_WS_COMPRESSION picks the policy:
+    off   never negotiate compression
+    on    compress every message, with context takeover (the old behaviour)
+    N     compress messages of N bytes or more (default 1024, like polling)
+SDP051_WS_COMPRESS_NAMESPACES, a comma separated list of Socket.IO
+namespaces, further limits a threshold policy to messages for those
+namespaces. Binary attachments carry no namespace and stay uncompressed.
+"""
+
+import os
+
+from simple_websocket import Compression
+
+DEFAULT_THRESHOLD = 1024
+
+
+def packet_namespace(data):
+    """Namespace of the Socket.IO packet in an Engine.IO text message, None for anything else"""
+    # "4" (Engine.IO MESSAGE), the Socket.IO packet type, "<attachments>-"
+    # for binary events, then "/nsp," unless the namespace is "/"
+    if data[:1] != b"4" or not data[1:2].isdigit():
+        return None
+    i = 2
+    while data[i:i + 1].isdigit():
+        i += 1
+    if data[i:i + 1] != b"-":
+        i = 2
+    else:
+        i += 1
+    if data[i:i + 1] != b"/":
+        return "/"
+    end = data.find(b",", i)
+    return bytes(data[i:end if end != -1 else None]).decode(errors="replace")
+
+
+def make_compression(setting=None, namespaces=None):
+    """The websocket_compression server option for a SDP051_WS_COMPRESSION setting"""
+    setting = (setting or str(DEFAULT_THRESHOLD)).strip().lower()
+    if setting == "off":
+        return False
+    if setting == "on":
+        return True
+    message_filter = None
+    if namespaces:
+        names = {name.strip() for name in namespaces.split(",") if name.strip()}
+
+        def message_filter(data):
+            return packet_namespace(data) in names
+    return Compression(threshold=int(setting), message_filter=message_filter)
+
+
+WS_COMPRESSION = make_compression(os.environ.get("SDP051_WS_COMPRESSION"),
+                                  os.environ.get("SDP051_WS_COMPRESS_NAMESPACES"))